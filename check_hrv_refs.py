@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+check_hrv_refs.py
+
+Randomized equivalence check for the HRV binning_data fallback lookup (hrv._RefIndex).
+
+Usage:
+    python check_hrv_refs.py [--rounds N] [--seed S]
+
+Each round writes a directory of random .json names (names with an inner ".json", names
+that are suffixes of each other, shared prefixes), indexes it with export_fs.JsonIndex and
+checks that _RefIndex.resolve returns the same path as the original linear scan for the
+first indexed name with `ref in name or name in ref`.
+"""
+
+import sys
+import random
+import tempfile
+import pathlib
+from export_fs import JsonIndex
+from hrv import _RefIndex
+
+TOKENS = ["a", "b", "ab", ".", "-", ".json", "json", "x.binning_data"]
+
+
+def random_name(rng, min_tokens=0):
+    return "".join(rng.choice(TOKENS) for _ in range(rng.randint(min_tokens, 4)))
+
+
+def scan(ref, index):
+    """The lookup _RefIndex replaces: first name in index order either way round."""
+    for name in index:
+        if ref in name or name in ref:
+            return index.first(name)
+    return None
+
+
+def check(rng, rounds):
+    for i in range(rounds):
+        with tempfile.TemporaryDirectory() as tmp:
+            root = pathlib.Path(tmp)
+            for _ in range(rng.randint(0, 40)):
+                name = random_name(rng) + ".json"
+                if name not in (".json", "..json"):
+                    (root / name).write_text("{}", encoding="utf-8")
+            index = JsonIndex(root)
+            names = list(index)
+            ref_index = _RefIndex(index)
+            refs = [random_name(rng, 1) for _ in range(20)]
+            refs += [random_name(rng) + ".json" for _ in range(20)]
+            refs += [n[rng.randint(0, len(n) - 1):] for n in names]  # suffixes of indexed names
+            refs += [random_name(rng) + n + random_name(rng) for n in rng.sample(names, min(5, len(names)))]
+            for ref in refs:
+                want, got = scan(ref, index), ref_index.resolve(ref)
+                if want != got:
+                    return f"round {i}: {ref!r} resolved to {got} instead of {want} (names: {names})"
+    return None
+
+
+def main():
+    rounds = 200
+    seed = 0
+    if "--rounds" in sys.argv:
+        rounds = int(sys.argv[sys.argv.index("--rounds") + 1])
+    if "--seed" in sys.argv:
+        seed = int(sys.argv[sys.argv.index("--seed") + 1])
+    error = check(random.Random(seed), rounds)
+    print(f"[check_hrv_refs] {error or f'ok ({rounds} rounds)'}")
+    sys.exit(1 if error else 0)
+
+
+if __name__ == "__main__":
+    main()
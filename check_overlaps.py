@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+check_overlaps.py
+
+Randomized equivalence checks for the pedometer overlap dedup (overlaps.py).
+
+Usage:
+    python check_overlaps.py [--rounds N] [--seed S]
+
+Compares _union / _covered / kept_share against a plain per-segment brute force,
+and the chunked (two-pass) pedometer read against the in-memory one on a generated
+export with overlapping phone/watch/band segments: monthly totals, the daily cube and
+the activity heatmap must match exactly.
+"""
+
+import sys
+import random
+import tempfile
+import pathlib
+from datetime import datetime, timedelta
+import numpy as np
+import overlaps
+import steps
+
+# ---------- brute force ----------
+def brute_union(pairs):
+    out = []
+    for a, b in sorted(pairs):
+        if out and a <= out[-1][1]:
+            out[-1][1] = max(out[-1][1], b)
+        else:
+            out.append([a, b])
+    return out
+
+def brute_overlap(a, b, union):
+    return sum(max(0, min(b, e) - max(a, s)) for s, e in union)
+
+def brute_kept_share(start, end, ranks):
+    share = []
+    for s, e, r in zip(start, end, ranks):
+        if e <= s:
+            share.append(1.0)
+            continue
+        higher = [(s2, e2) for s2, e2, r2 in zip(start, end, ranks) if r2 < r and e2 > s2]
+        share.append(1.0 - brute_overlap(s, e, brute_union(higher)) / (e - s))
+    return np.array(share)
+
+def random_segments(rng, n):
+    start = np.array([rng.randint(0, 500) for _ in range(n)], dtype="int64")
+    # mostly short segments, some empty or reversed (kept whole)
+    end = start + np.array([rng.choice([0, -3, rng.randint(1, 60), rng.randint(1, 8)]) for _ in range(n)], dtype="int64")
+    ranks = np.array([rng.randint(0, 3) for _ in range(n)], dtype="int64")
+    return start, end, ranks
+
+def check_intervals(rng, rounds):
+    for i in range(rounds):
+        start, end, ranks = random_segments(rng, rng.randint(1, 40))
+        valid = end > start
+        if valid.any():
+            a, b = overlaps._union(start[valid], end[valid])
+            expect = brute_union(zip(start[valid].tolist(), end[valid].tolist()))
+            if [list(p) for p in zip(a.tolist(), b.tolist())] != expect:
+                return f"_union differs in round {i}"
+            xs = np.array([rng.randint(-10, 600) for _ in range(20)], dtype="int64")
+            got = overlaps._covered(a, b, xs)
+            want = [brute_overlap(-10**9, x, expect) for x in xs.tolist()]
+            if got.tolist() != want:
+                return f"_covered differs in round {i}"
+        got = overlaps.kept_share(start, end, ranks)
+        if not np.allclose(got, brute_kept_share(start, end, ranks), rtol=0, atol=1e-12):
+            return f"kept_share differs in round {i}"
+    return None
+
+# ---------- streamed vs in-memory ----------
+PED_COLUMNS = [
+    "com.samsung.health.step.start_time", "com.samsung.health.step.end_time", "com.samsung.health.step.count",
+    "run_step", "walk_step", "com.samsung.health.step.time_offset", "com.samsung.health.step.deviceuuid",
+    "com.samsung.health.step.datauuid",
+]
+
+def write_pedometer(path, rng, n):
+    base = datetime(2023, 1, 1)
+    fmt = lambda d: d.strftime("%Y-%m-%d %H:%M:%S.000")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("com.samsung.shealth.tracker.pedometer_step_count,6313005,3\n")
+        f.write(",".join(PED_COLUMNS) + ",\n")
+        for i in range(n):
+            t = base + timedelta(seconds=rng.randint(0, 86400 * 60))
+            e = t + timedelta(seconds=rng.randint(0, 1800))
+            count = rng.randint(0, 3000)
+            device = rng.choice(["phone", "watch", "band"])
+            f.write(",".join([fmt(t), fmt(e), str(count), "0", str(count), "UTC+0900", device, f"uuid-{i}"]) + ",\n")
+
+def check_streaming(rng, rounds):
+    for i in range(rounds):
+        with tempfile.TemporaryDirectory() as tmp:
+            base = pathlib.Path(tmp)
+            write_pedometer(base / "com.samsung.shealth.tracker.pedometer_step_count.20240101.csv", rng, rng.randint(50, 2000))
+            memory = steps.summarize_steps(base)
+            streamed = steps.summarize_steps(base, chunksize=rng.randint(7, 400))
+        if not np.array_equal(memory["detailed"].to_numpy("float64"), streamed["detailed"].to_numpy("float64")):
+            return f"monthly totals differ in round {i}"
+        if not memory["heatmap"].equals(streamed["heatmap"]):
+            return f"heatmap differs in round {i}"
+        cubes = [
+            steps.rollup_steps(s["cube"], "day", by_device=True)["steps"].sort_index()
+            for s in (memory, streamed)
+        ]
+        if not cubes[0].equals(cubes[1]):
+            return f"daily cube differs in round {i}"
+        if (memory["heatmap"].to_numpy() % 1).any():
+            return f"fractional steps in round {i}"
+    return None
+
+# ---------- main ----------
+def main():
+    rounds = 200
+    seed = 0
+    if "--rounds" in sys.argv:
+        rounds = int(sys.argv[sys.argv.index("--rounds") + 1])
+    if "--seed" in sys.argv:
+        seed = int(sys.argv[sys.argv.index("--seed") + 1])
+    rng = random.Random(seed)
+    failed = False
+    for name, check, n in (("intervals", check_intervals, rounds), ("streaming", check_streaming, max(1, rounds // 20))):
+        error = check(rng, n)
+        print(f"[check_overlaps] {name}: {error or f'ok ({n} rounds)'}")
+        failed |= error is not None
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
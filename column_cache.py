@@ -0,0 +1,78 @@
+# column_cache.py
+from collections import OrderedDict
+
+# In-process cache of converted columns, keyed by (table source, column, transform), so a
+# column parsed once (e.g. a timestamp column through clean_ts) is reused by every other
+# consumer in the same run. Loaders tag each table with df.attrs["source"]; frames without
+# a tag (chunks, derived subsets) are simply not cached.
+
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+_entries = OrderedDict()
+_sizes = {}
+_max_bytes = DEFAULT_MAX_BYTES
+_total = 0
+
+
+def configure(max_bytes=DEFAULT_MAX_BYTES):
+    global _max_bytes
+    _max_bytes = max_bytes
+    _evict()
+
+
+def clear():
+    global _total
+    _entries.clear()
+    _sizes.clear()
+    _total = 0
+
+
+def tag(df, source, table=None):
+    """
+    Mark df as the full table loaded from source (a string identifying file + read options).
+    table names the export table it belongs to (see loaders.table_name), if known.
+    """
+    df.attrs["source"] = source
+    if table:
+        df.attrs["table"] = table
+    return df
+
+
+def cached_column(df, column, transform, compute):
+    """
+    compute(df[column]), memoized under (df's source tag, column, transform).
+    The cached Series is only reused when its index still matches df's.
+    """
+    source = df.attrs.get("source")
+    if source is None:
+        return compute(df[column])
+    key = (source, column, transform)
+    hit = _entries.get(key)
+    if hit is not None and hit.index.equals(df.index):
+        _entries.move_to_end(key)
+        return hit
+    result = compute(df[column])
+    if result is not None:
+        _store(key, result)
+    return result
+
+
+def _store(key, series):
+    global _total
+    size = int(series.memory_usage(index=True, deep=False))
+    if size > _max_bytes:
+        return
+    if key in _entries:
+        _total -= _sizes.pop(key)
+        del _entries[key]
+    _entries[key] = series
+    _sizes[key] = size
+    _total += size
+    _evict()
+
+
+def _evict():
+    global _total
+    while _total > _max_bytes and _entries:
+        key, _ = _entries.popitem(last=False)
+        _total -= _sizes.pop(key)
@@ -0,0 +1,157 @@
+# export_fs.py
+import fnmatch
+import os
+import posixpath
+import zipfile
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+
+class ExportZipPath(zipfile.Path):
+    """
+    zipfile.Path with the pathlib bit the loaders use (glob of the export root's CSVs),
+    plus zipinfo for change detection, so a samsunghealth_*.zip can be read in place.
+    Members are decompressed on demand.
+    """
+
+    def glob(self, pattern):
+        return [p for p in self.iterdir() if fnmatch.fnmatchcase(p.name, pattern)]
+
+    def zipinfo(self):
+        return self.root.getinfo(self.at)
+
+
+def open_export(path: Path):
+    """
+    Directory -> returned as is. Zip archive -> ExportZipPath at the export root
+    (descending into the single top-level folder Samsung wraps exports in).
+    """
+    path = Path(path)
+    if not (path.is_file() and zipfile.is_zipfile(path)):
+        return path
+    root = ExportZipPath(zipfile.ZipFile(path.resolve()))
+    entries = list(root.iterdir())
+    if len(entries) == 1 and entries[0].is_dir() and not root.glob("*.csv"):
+        root = entries[0]
+    return root
+
+
+def is_zip(path):
+    return isinstance(path, zipfile.Path)
+
+
+def local_dir(base):
+    """Real directory to write outputs (summary, caches) next to the export."""
+    if is_zip(base):
+        return Path(base.root.filename).parent
+    return Path(base)
+
+
+def source_id(path):
+    return str(path) if is_zip(path) else str(path.resolve())
+
+
+@contextmanager
+def csv_source(path):
+    """What to hand read_csv: the path itself, or an open member stream for zip exports."""
+    if is_zip(path):
+        with path.open("rb") as f:
+            yield f
+    else:
+        yield path
+
+
+def signature(path):
+    """
+    (size, mtime, content_tag) for change detection. Zip members carry a CRC of their
+    full content, so content_tag is set for them and None for plain files.
+    """
+    if is_zip(path):
+        info = path.zipinfo()
+        mtime = datetime(*info.date_time).timestamp()
+        return info.file_size, mtime, f"crc{info.CRC:08x}"
+    st = path.stat()
+    return st.st_size, st.st_mtime_ns, None
+
+
+def mtime(path):
+    if is_zip(path):
+        return datetime(*path.zipinfo().date_time).timestamp()
+    return os.path.getmtime(path)
+
+
+class JsonIndex:
+    """
+    filename -> paths of the .json files under one jsons/<table>/ directory (including its
+    UUID-prefix shard subfolders), built on first use. Only that table's directory is
+    walked (os.scandir, or the archive's name list for zips), paths are kept as strings,
+    and Path objects are made only for the names that are looked up.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self._names = None
+
+    def _build(self):
+        names = {}
+        if is_zip(self.root):
+            prefix = self.root.at
+            for member in self.root.root.namelist():
+                if member.startswith(prefix) and member.endswith(".json"):
+                    names.setdefault(posixpath.basename(member), []).append(member)
+        elif self.root.is_dir():
+            stack = [str(self.root)]
+            while stack:
+                with os.scandir(stack.pop()) as it:
+                    entries = sorted(it, key=lambda e: e.name)
+                subdirs = []
+                for entry in entries:
+                    if entry.is_dir():
+                        subdirs.append(entry.path)
+                    elif entry.name.endswith(".json"):
+                        names.setdefault(entry.name, []).append(entry.path)
+                stack.extend(reversed(subdirs))
+        self._names = names
+        return names
+
+    @property
+    def names(self):
+        return self._names if self._names is not None else self._build()
+
+    def _path(self, p):
+        return self.root.__class__(self.root.root, p) if is_zip(self.root) else Path(p)
+
+    def get(self, name, default=None):
+        hits = self.names.get(name)
+        return [self._path(p) for p in hits] if hits else default
+
+    def first(self, name):
+        return self._path(self.names[name][0])
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.names
+
+
+_json_indexes = {}
+
+
+def json_index(base, table):
+    """
+    Shared JsonIndex for base/jsons/<table>; falls back to the whole jsons/ tree for
+    exports that do not split it per table.
+    """
+    jsons = base / "jsons"
+    root = jsons / table
+    if not root.is_dir():
+        root = jsons
+    key = source_id(root)
+    if key not in _json_indexes:
+        _json_indexes[key] = JsonIndex(root)
+    return _json_indexes[key]
@@ -1,8 +1,16 @@
 # hrv.py
+import bisect
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+import numpy as np
 import pandas as pd
+from loaders import sniff_header_row, read_table, load_shards
+from export_fs import mtime as file_mtime, signature, source_id, json_index
+import table_cache
+from timekeys import month_key, day_key, month_label
+from column_cache import cached_column
 
 
 def _smart_load_hrv_csv(path: Path, debug=False) -> pd.DataFrame:
@@ -10,16 +18,9 @@ def _smart_load_hrv_csv(path: Path, debug=False) -> pd.DataFrame:
         if debug:
             print(f"[hrv] [DEBUG] missing {path.name}")
         return pd.DataFrame()
-    def try_read(h):
-        try:
-            return pd.read_csv(path, header=h, engine="python", dtype=str, on_bad_lines="skip")
-        except Exception:
-            return pd.DataFrame()
-    df0 = try_read(0)
-    df1 = try_read(1)
-    pick = df1 if ("start_time" in df1.columns and "binning_data" in df1.columns) else df0
+    hdr = sniff_header_row(path, require=["start_time", "binning_data"])
+    pick = read_table(path, header=hdr, debug=debug)
     if debug:
-        hdr = "1" if pick is df1 else "0"
         print(f"[hrv] [DEBUG] Loading {path.name}: header={hdr}, shape={pick.shape}")
         print(f"[hrv] [DEBUG] Columns: {list(pick.columns)}")
         with pd.option_context("display.max_columns", None, "display.width", 220):
@@ -48,54 +49,263 @@ def _extract_date_from_json(json_obj):
     return None
 
 
-def _date_from_row_fields(row):
+def _parse_row_time(series):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        return series
+    try:
+        return pd.to_datetime(series, errors="coerce", format="mixed")
+    except Exception:
+        return pd.Series(pd.NaT, index=series.index, dtype="datetime64[ns]")
+
+
+def _row_fallback_dates(df):
+    """
+    Per-row fallback date for histograms whose JSON carries none: update_time, else
+    create_time (whichever is on or after 2005). Each column is parsed once, through the
+    shared column cache.
+    """
+    dates = None
     for col in ("update_time", "create_time"):
-        val = row.get(col)
-        if isinstance(val, str):
-            try:
-                dt = pd.to_datetime(val, errors="coerce")
-                if not pd.isna(dt) and dt.year >= 2005:
-                    return dt
-            except Exception:
-                pass
-    return None
+        if col not in df.columns:
+            continue
+        parsed = cached_column(df, col, "to_datetime", _parse_row_time)
+        valid = parsed.where(parsed.dt.year >= 2005)
+        dates = valid if dates is None else dates.combine_first(valid)
+    if dates is None:
+        dates = pd.Series(pd.NaT, index=df.index, dtype="datetime64[ns]")
+    return dates
+
+
+HRV_JSON_TABLE = "com.samsung.health.hrv"
+
+
+def _hrv_json_index(base_path: Path, debug=False):
+    """Shared index of the HRV binning_data JSONs (jsons/com.samsung.health.hrv/ only)."""
+    index = json_index(base_path, HRV_JSON_TABLE)
+    if debug:
+        print(f"[hrv] [DEBUG] Indexed {len(index)} JSON file names under {index.root}")
+        if len(index):
+            print(f"[hrv] [DEBUG] Index keys (first 10): {list(index)[:10]}")
+    return index
+
 
+BINNING_SUFFIX = ".binning_data.json"
+ROW_META = ("create_sh_ver", "modify_sh_ver", "deviceuuid")
 
-def _build_json_index(json_dir: Path, debug=False):
+
+def _binning_refs(df):
+    """
+    Per-row histogram reference: the stripped binning_data value if it names a
+    .binning_data.json file, else the first string cell in the row that does (NaN if none).
+    """
+    refs = pd.Series(pd.NA, index=df.index, dtype="object")
+    cols = ["binning_data"] if "binning_data" in df.columns else []
+    cols += [c for c in df.columns if c != "binning_data"]
+    for col in cols:
+        if not (pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col])):
+            continue
+        todo = refs.isna()
+        if not todo.any():
+            break
+        vals = df[col][todo].str.strip()  # NaN for non-string cells
+        hit = vals.str.endswith(BINNING_SUFFIX).fillna(False).astype(bool)
+        refs[hit[hit].index] = vals[hit]
+    return refs
+
+
+class _RefIndex:
     """
-    Walk json_dir once and index all .binning_data.json filenames to their full paths.
-    Returns dict: filename -> [Path, ...]
+    Same answer as scanning the JSON index in order for the first name with
+    `ref in name or name in ref`, without the scan. All indexed names end in ".json", so:
+      - name in ref: name is one of ref's substrings ending at a ".json" in ref, which are
+        looked up directly (O(len(ref)) dict probes);
+      - ref in name (ref ending in ".json"): ref is a suffix of name unless name has another
+        ".json" inside; suffixes are prefixes of the reversed names, found by bisect on the
+        sorted reversed names, with a sparse table giving the earliest name in the range.
+        The few names with an inner ".json" are checked directly.
     """
-    index = {}
-    if not json_dir.exists():
+
+    def __init__(self, index):
+        self.index = index
+        self.names = None
+
+    def _build(self):
+        # built on the first fallback lookup; exports whose references all match exactly never pay for it
+        self.names = list(self.index)
+        self.order = {n: i for i, n in enumerate(self.names)}
+        self.odd = [i for i, n in enumerate(self.names) if n.count(".json") != 1 or not n.endswith(".json")]
+        rev = sorted((n[::-1], i) for i, n in enumerate(self.names))
+        self.rev_names = [r for r, _ in rev]
+        self.table = [np.array([i for _, i in rev], dtype="int64")]
+        width = 1
+        while width * 2 <= len(rev):
+            prev = self.table[-1]
+            self.table.append(np.minimum(prev[:-width], prev[width:]))
+            width *= 2
+
+    def _range_min(self, lo, hi):
+        level = (hi - lo).bit_length() - 1
+        t = self.table[level]
+        return int(min(t[lo], t[hi - (1 << level)]))
+
+    def _name_in_ref(self, ref):
+        best = None
+        end = ref.find(".json")
+        while end != -1:
+            stop = end + len(".json")
+            for start in range(end + 1):
+                i = self.order.get(ref[start:stop])
+                if i is not None and (best is None or i < best):
+                    best = i
+            end = ref.find(".json", stop)
+        return best
+
+    def _ref_in_name(self, ref):
+        if not ref.endswith(".json"):
+            return min((i for i, n in enumerate(self.names) if ref in n), default=None)
+        key = ref[::-1]
+        lo = bisect.bisect_left(self.rev_names, key)
+        hi = bisect.bisect_left(self.rev_names, key + "\U0010ffff")
+        best = self._range_min(lo, hi) if hi > lo else None
+        for i in self.odd:
+            if best is not None and i >= best:
+                break
+            if ref in self.names[i]:
+                best = i
+        return best
+
+    def resolve(self, ref):
+        if self.names is None:
+            self._build()
+        hits = [i for i in (self._name_in_ref(ref), self._ref_in_name(ref)) if i is not None]
+        return self.index.first(self.names[min(hits)]) if hits else None
+
+
+def _resolve_json(ref, index, ref_index):
+    # 1. exact lookup in prebuilt index
+    candidates = index.get(ref)
+    if candidates:
+        return candidates[0]
+    # 2. fallback: first indexed name that contains the token or is contained in it
+    return ref_index.resolve(ref)
+
+
+def _read_histogram(json_path, debug=False):
+    """First histogram dict of a binning_data JSON file, or None."""
+    try:
+        raw = json.loads(json_path.read_text(encoding="utf-8"))
+    except Exception as e:
         if debug:
-            print(f"[hrv] JSON directory {json_dir} does not exist.")
-        return index
+            print(f"[hrv] failed to parse JSON {json_path}: {e}")
+        return None
 
-    # More thorough search - look for any JSON files
-    json_files = list(json_dir.rglob("*.json"))
+    if isinstance(raw, list):
+        if not raw:
+            if debug:
+                print(f"[hrv] empty list in {json_path}, skipping.")
+            return None
+        return raw[0]
+    if isinstance(raw, dict):
+        return raw
     if debug:
-        print(f"[hrv] [DEBUG] Found {len(json_files)} total JSON files in {json_dir}")
-        if json_files:
-            print(f"[hrv] [DEBUG] Sample JSON files: {[f.name for f in json_files[:5]]}")
+        print(f"[hrv] unexpected JSON top-level type {type(raw)} in {json_path}, skipping.")
+    return None
 
-    # Index both full names and base names (without .binning_data.json)
-    for p in json_files:
-        name = p.name
-        index.setdefault(name, []).append(p)
 
-        # Also index by the UUID part if it's a .binning_data.json file
-        if name.endswith('.binning_data.json'):
-            uuid_part = name.replace('.binning_data.json', '')
-            index.setdefault(uuid_part + '.binning_data.json', []).append(p)
+def _extract_histogram(json_path, debug=False):
+    """(json date or None, sdnn, rmssd, total_samples) of a binning_data JSON, or None."""
+    j_dict = _read_histogram(json_path, debug=debug)
+    if j_dict is None:
+        return None
+    sdnn = j_dict.get("sdnn")
+    rmssd = j_dict.get("rmssd")
+    total_samples = j_dict.get("total_samples")
+    return (
+        _extract_date_from_json(j_dict),
+        float(sdnn) if sdnn is not None else None,
+        float(rmssd) if rmssd is not None else None,
+        int(total_samples) if total_samples is not None else None,
+    )
 
-    if debug:
-        print(f"[hrv] Indexed {len(index)} unique JSON file patterns.")
-        print(f"[hrv] [DEBUG] Index keys (first 10): {list(index.keys())[:10]}")
-    return index
+
+# JSON reads are I/O bound (often on network storage), so more threads than cores pay off
+DEFAULT_JOBS = min(32, (os.cpu_count() or 1) * 4)
 
 
-def summarize_hrv(base_path: Path, debug=False):
+def _pool_map(fn, json_paths, jobs=None):
+    """[fn(path) for path in json_paths] through a bounded thread pool."""
+    jobs = jobs or DEFAULT_JOBS
+    if jobs <= 1 or len(json_paths) <= 1:
+        return [fn(p) for p in json_paths]
+    with ThreadPoolExecutor(max_workers=min(jobs, len(json_paths))) as pool:
+        return list(pool.map(fn, json_paths))
+
+
+def _read_histograms(json_paths, jobs=None, debug=False):
+    """{path: _extract_histogram(path)}, read through a bounded thread pool; order follows json_paths."""
+    return dict(zip(json_paths, _pool_map(lambda p: _extract_histogram(p, debug=debug), json_paths, jobs)))
+
+
+# ---------- extraction cache ----------
+# Exports only ever add nights, so the extracted values of each JSON are kept in the table
+# cache dir (one frame per export) and reused while the file's size and mtime still match.
+EXTRACT_COLUMNS = ["path", "stamp", "ok", "json_date", "sdnn", "rmssd", "total_samples"]
+
+
+def _stamp(json_path):
+    try:
+        size, mtime, _ = signature(json_path)
+    except OSError:
+        return None  # removed since the directory was listed; its read fails as well
+    return f"{size}:{mtime}"
+
+
+def _cached_histograms(base_path, json_paths, jobs=None, debug=False):
+    """_read_histograms, reading only the files the extraction cache does not cover."""
+    if not table_cache.enabled():
+        return _read_histograms(json_paths, jobs=jobs, debug=debug)
+    name = f"hrv_extract|{source_id(base_path)}"
+    cached = table_cache.load_named(name, debug=debug)
+    known = {}
+    if cached is not None and list(cached.columns) == EXTRACT_COLUMNS:
+        for path, stamp, ok, json_date, sdnn, rmssd, total in cached.itertuples(index=False):
+            if not ok:
+                known[path] = (stamp, None)
+                continue
+            known[path] = (stamp, (
+                None if pd.isna(json_date) else json_date,
+                None if pd.isna(sdnn) else float(sdnn),
+                None if pd.isna(rmssd) else float(rmssd),
+                None if pd.isna(total) else int(total),
+            ))
+
+    # stat calls are as slow as the reads on network storage, so they go through the pool too
+    stamps = dict(zip(json_paths, _pool_map(_stamp, json_paths, jobs)))
+    out = {}
+    stale = []
+    for p in json_paths:
+        hit = known.get(str(p))
+        if hit is not None and hit[0] == stamps[p]:
+            out[p] = hit[1]
+        else:
+            stale.append(p)
+    if debug:
+        print(f"[hrv] [DEBUG] Extraction cache: {len(out)} reused, {len(stale)} to read")
+    if not stale:
+        return out
+    out.update(_read_histograms(stale, jobs=jobs, debug=debug))
+
+    entries = [(str(p), stamps[p], out[p] is not None, *(out[p] or (None,) * 4)) for p in json_paths]
+    frame = pd.DataFrame.from_records(entries, columns=EXTRACT_COLUMNS)
+    try:
+        frame["json_date"] = pd.to_datetime(frame["json_date"])
+    except (TypeError, ValueError):
+        pass  # mixed time zones stay objects; store_named reports it if the format refuses them
+    table_cache.store_named(name, frame, debug=debug)
+    return {p: out[p] for p in json_paths}
+
+
+def summarize_hrv(base_path: Path, debug=False, jobs=None):
     hrv_files = list(base_path.glob("com.samsung.health.hrv*.csv"))
 
     if debug:
@@ -107,110 +317,71 @@ def summarize_hrv(base_path: Path, debug=False):
             print("[hrv] No HRV CSV found.")
         return {"daily": pd.DataFrame(), "monthly": pd.DataFrame()}
 
-    hrv_csv = hrv_files[0]  # Use the first HRV file found
-    if debug:
-        print(f"[hrv] [DEBUG] Using HRV file: {hrv_csv.name}")
-
-    df = _smart_load_hrv_csv(hrv_csv, debug=debug)
+    df = load_shards(hrv_files, lambda p: _smart_load_hrv_csv(p, debug=debug), debug=debug)
     if df.empty:
         return {"daily": pd.DataFrame(), "monthly": pd.DataFrame()}
 
-    json_dir = base_path / "jsons"
-    json_index = _build_json_index(json_dir, debug=debug)
-
-    records = []
-    processed_count = 0
-    found_count = 0
-
-    for idx, row in df.iterrows():
-        processed_count += 1
-        if debug and processed_count % 1000 == 0:
-            print(f"[hrv] [DEBUG] Processed {processed_count} rows, found {found_count} JSON files")
-
-        bin_ref = row.get("binning_data")
-        if not (isinstance(bin_ref, str) and bin_ref.strip().endswith(".binning_data.json")):
-            bin_ref = None
-            for v in row.values:
-                if isinstance(v, str) and v.strip().endswith(".binning_data.json"):
-                    bin_ref = v.strip()
-                    break
-        if not bin_ref:
-            if debug and processed_count <= 5:  # Only show first few
-                print(f"[hrv] no valid binning_data field in row {idx}; skipping")
-            continue
-
-        bin_ref_clean = bin_ref.strip()
-        json_path = None
+    index = _hrv_json_index(base_path, debug=debug)
 
-        # Try multiple lookup strategies
-        # 1. exact lookup in prebuilt index
-        candidates = json_index.get(bin_ref_clean)
-        if candidates:
-            json_path = candidates[0]
-        else:
-            # 2. fallback: any indexed name that contains the token substring
-            for name, paths in json_index.items():
-                if bin_ref_clean in name or name in bin_ref_clean:
-                    json_path = paths[0]
-                    break
-
-        if not json_path or not json_path.exists():
-            if debug and found_count < 5:  # Only show first few failures
-                print(f"[hrv] histogram JSON {bin_ref_clean} not found for row {idx} via index.")
-            continue
+    # Resolve references, paths and row metadata column-wise; only the JSON reads are per file.
+    refs = _binning_refs(df)
+    if debug:
+        for idx in refs.index[refs.isna()][:5]:
+            print(f"[hrv] no valid binning_data field in row {idx}; skipping")
+    rows = pd.DataFrame({"ref": refs, "fallback": _row_fallback_dates(df)})
+    for col in ROW_META:
+        rows[col] = df[col] if col in df.columns else None
+    rows = rows[rows["ref"].notna()]
+
+    ref_index = _RefIndex(index)
+    paths = {}
+    for ref in rows["ref"].unique():
+        # indexed paths come from the directory listing, so no exists() call per file here;
+        # one removed since then fails its read and is skipped like an unreadable JSON
+        paths[ref] = _resolve_json(ref, index, ref_index)
+    rows["json_path"] = rows["ref"].map(paths)
+    if debug:
+        for idx, ref in rows.loc[rows["json_path"].isna(), "ref"][:5].items():
+            print(f"[hrv] histogram JSON {ref} not found for row {idx} via index.")
+    rows = rows[rows["json_path"].notna()]
 
-        found_count += 1
-        try:
-            raw = json.loads(json_path.read_text(encoding="utf-8"))
-        except Exception as e:
-            if debug:
-                print(f"[hrv] failed to parse JSON {json_path}: {e}")
-            continue
+    histograms = _cached_histograms(base_path, list(rows["json_path"].unique()), jobs=jobs, debug=debug)
 
-        if isinstance(raw, list):
-            if not raw:
-                if debug:
-                    print(f"[hrv] empty list in {json_path}, skipping.")
-                continue
-            j_dict = raw[0]
-        elif isinstance(raw, dict):
-            j_dict = raw
-        else:
-            if debug:
-                print(f"[hrv] unexpected JSON top-level type {type(raw)} in {json_path}, skipping.")
+    records = []
+    for ref, fallback, create_ver, modify_ver, device, json_path in zip(
+        rows["ref"], rows["fallback"], rows["create_sh_ver"], rows["modify_sh_ver"], rows["deviceuuid"], rows["json_path"]
+    ):
+        extracted = histograms[json_path]
+        if extracted is None:
             continue
-
-        date = _extract_date_from_json(j_dict) or _date_from_row_fields(row)
+        json_date, sdnn, rmssd, total_samples = extracted
+        date = json_date or (None if pd.isna(fallback) else fallback)
         if date is None:
             try:
-                mtime = os.path.getmtime(json_path)
+                mtime = file_mtime(json_path)
                 date = pd.to_datetime(mtime, unit="s", errors="coerce")
             except Exception:
                 date = None
         if date is None or pd.isna(date):
-            if debug and found_count <= 5:
-                print(f"[hrv] could not determine date for histogram {bin_ref_clean} (row {idx}); skipping.")
+            if debug:
+                print(f"[hrv] could not determine date for histogram {ref}; skipping.")
             continue
         date = pd.to_datetime(date).normalize()
 
-        sdnn = j_dict.get("sdnn")
-        rmssd = j_dict.get("rmssd")
-        total_samples = j_dict.get("total_samples")
-
         records.append(
             {
                 "date": date,
-                "sdnn": float(sdnn) if sdnn is not None else None,
-                "rmssd": float(rmssd) if rmssd is not None else None,
-                "total_samples": int(total_samples) if total_samples is not None else None,
-                "create_sh_ver": row.get("create_sh_ver"),
-                "modify_sh_ver": row.get("modify_sh_ver"),
-                "deviceuuid": row.get("deviceuuid"),
+                "sdnn": sdnn,
+                "rmssd": rmssd,
+                "total_samples": total_samples,
+                "create_sh_ver": create_ver,
+                "modify_sh_ver": modify_ver,
+                "deviceuuid": device,
             }
         )
 
     if debug:
-        print(f"[hrv] [DEBUG] Final stats: processed {processed_count} rows, found {found_count} JSON files, extracted {len(records)} records")
+        print(f"[hrv] [DEBUG] Final stats: processed {len(df)} rows, found {len(rows)} JSON files, extracted {len(records)} records")
 
     if not records:
         if debug:
@@ -222,14 +393,15 @@ def summarize_hrv(base_path: Path, debug=False):
         daily_df.sort_values(["deviceuuid", "date", "modify_sh_ver"])
         .drop_duplicates(subset=["deviceuuid", "date"], keep="last")
     )
-    daily_df["month"] = daily_df["date"].dt.to_period("M")
+    daily_df["month"] = month_key(daily_df["date"])
+    daily_df["day"] = day_key(daily_df["date"])
 
     monthly = (
         daily_df.groupby("month")
         .agg(
             avg_rmssd=pd.NamedAgg(column="rmssd", aggfunc=lambda x: round(pd.to_numeric(x, errors="coerce").mean(), 1)),
             avg_sdnn=pd.NamedAgg(column="sdnn", aggfunc=lambda x: round(pd.to_numeric(x, errors="coerce").mean(), 1)),
-            days_with_hrv=pd.NamedAgg(column="date", aggfunc="nunique"),
+            days_with_hrv=pd.NamedAgg(column="day", aggfunc="nunique"),
         )
         .reset_index()
         .set_index("month")
@@ -243,9 +415,9 @@ def format_hrv_section(summary_dict):
     if monthly.empty:
         return "=== HRV ===\nNo HRV data found or unable to determine date for records.\n"
     lines = ["=== HRV ==="]
-    for m in sorted(monthly.index.astype(str)):
-        row = monthly.loc[pd.Period(m)]
-        lines.append(f"\n===== {m} =====")
+    for k in sorted(monthly.index):
+        row = monthly.loc[k]
+        lines.append(f"\n===== {month_label(k)} =====")
         rmssd = row.get("avg_rmssd", "?")
         sdnn = row.get("avg_sdnn", "?")
         days = row.get("days_with_hrv", 0)
@@ -19,6 +19,9 @@ import pathlib
 import pandas as pd
 import csv
 
+sys.path.insert(0, str(pathlib.Path(__file__).resolve().parent.parent))
+from loaders import read_table
+
 # ---------- helpers ----------
 def inspect_header_lines(path):
     with open(path, encoding="utf-8", errors="ignore") as f:
@@ -39,41 +42,21 @@ def load_csv(path, debug=False):
         header_row = 1
 
     def try_read(hdr):
-        try:
-            df = pd.read_csv(
-                path,
-                header=hdr,
-                engine="python",
-                sep=",",
-                on_bad_lines="warn",
-                dtype=str,
-            )
-            return df
-        except Exception:
-            return pd.DataFrame()
+        # raw str view on purpose: this tool is for looking at what is actually in the file
+        return read_table(path, header=hdr, on_bad_lines="warn", typed=False, debug=debug)
 
     df = try_read(header_row)
     if df.empty and header_row != 0:
         df = try_read(0)
     if df.empty:
         # last resort: no header promotion
-        try:
-            raw = pd.read_csv(
-                path,
-                header=None,
-                engine="python",
-                sep=",",
-                on_bad_lines="warn",
-                dtype=str,
-            )
-            if raw.shape[0] >= 2:
-                new_header = raw.iloc[1].fillna("").astype(str).tolist()
-                df = raw.iloc[2:].copy()
-                df.columns = new_header
-            else:
-                df = raw
-        except Exception:
-            df = pd.DataFrame()
+        raw = try_read(None)
+        if raw.shape[0] >= 2:
+            new_header = raw.iloc[1].fillna("").astype(str).tolist()
+            df = raw.iloc[2:].copy()
+            df.columns = new_header
+        else:
+            df = raw
     if debug:
         print(f"[DEBUG] {path.name} first lines: {lines}")
     return df
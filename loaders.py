@@ -0,0 +1,344 @@
+# loaders.py
+import csv
+import os
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+from pathlib import Path
+import column_cache
+import table_cache
+from export_fs import csv_source, source_id
+
+# ---------- header sniffing ----------
+def peek_rows(path: Path, n=2):
+    """
+    Read and tokenize only the first n non-blank lines of a CSV.
+    Samsung exports put a metadata line (table name, version, ...) above the real column line.
+    """
+    rows = []
+    with path.open("r", encoding="utf-8", errors="ignore", newline="") as f:
+        for row in csv.reader(f):
+            if not any(cell.strip() for cell in row):
+                continue
+            rows.append(row)
+            if len(rows) >= n:
+                break
+    return rows
+
+def sniff_header_row(path: Path, expect=None, require=None):
+    """
+    Decide which line (0 or 1) holds the column names without parsing the file body.
+    expect: pick line 1 if any of these substrings appear in it (and line 0 is not a better match).
+    require: pick line 1 only if every one of these names is an exact column on it.
+    Without either, the line with more fields wins.
+    """
+    try:
+        rows = peek_rows(path, 2)
+    except Exception:
+        return 0
+    row0 = rows[0] if rows else []
+    row1 = rows[1] if len(rows) > 1 else []
+    if require:
+        return 1 if all(r in row1 for r in require) else 0
+    if expect:
+        joined1 = " ".join(c.lower() for c in row1)
+        joined0 = " ".join(c.lower() for c in row0)
+        has1 = any(e.lower() in joined1 for e in expect)
+        has0 = any(e.lower() in joined0 for e in expect)
+        return 1 if has1 and (not has0 or len(row1) >= len(row0)) else 0
+    return 1 if len(row1) > len(row0) else 0
+
+def column_filter(columns):
+    """
+    Build a usecols callable keeping every column whose name contains one of the given
+    substrings (case-insensitive), matching how the aggregators look their columns up.
+    """
+    if not columns:
+        return None
+    needles = [c.lower() for c in columns]
+    return lambda name: any(n in str(name).lower() for n in needles)
+
+# ---------- table schemas ----------
+# Known Samsung Health tables, keyed by the file name without its timestamp suffix.
+# Listed columns are parsed straight into native types; anything not listed (and every
+# column of an unknown table) stays str. A table whose typed read fails falls back to str.
+SAMSUNG_TS_FORMAT = "%Y-%m-%d %H:%M:%S.%f"
+
+TABLE_SCHEMAS = {
+    "com.samsung.shealth.tracker.pedometer_step_count": {
+        "run_step": "int",
+        "walk_step": "int",
+        "duration": "int",
+        "sample_position_type": "int",
+        "com.samsung.health.step.count": "int",
+        "com.samsung.health.step.speed": "float",
+        "com.samsung.health.step.distance": "float",
+        "com.samsung.health.step.calorie": "float",
+        "com.samsung.health.step.start_time": "timestamp",
+        "com.samsung.health.step.end_time": "timestamp",
+        "com.samsung.health.step.create_time": "timestamp",
+        "com.samsung.health.step.update_time": "timestamp",
+    },
+    "com.samsung.shealth.tracker.pedometer_day_summary": {
+        "step_count": "int",
+        "run_step_count": "int",
+        "walk_step_count": "int",
+        "healthy_step": "int",
+        "active_time": "int",
+        "day_time": "int",
+        "speed": "float",
+        "distance": "float",
+        "calorie": "float",
+        "create_time": "timestamp",
+        "update_time": "timestamp",
+    },
+    "com.samsung.shealth.step_daily_trend": {
+        "count": "int",
+        "source_type": "int",
+        "day_time": "int",
+        "speed": "float",
+        "distance": "float",
+        "calorie": "float",
+        "create_time": "timestamp",
+        "update_time": "timestamp",
+    },
+    "com.samsung.health.hrv": {
+        "start_time": "timestamp",
+        "end_time": "timestamp",
+        "create_time": "timestamp",
+        "update_time": "timestamp",
+    },
+}
+
+_PANDAS_DTYPES = {"int": "Int64", "float": "float64"}
+
+def table_name(path: Path):
+    """com.samsung.health.hrv.20240101123456.csv -> com.samsung.health.hrv"""
+    stem = path.name[:-4] if path.name.lower().endswith(".csv") else path.name
+    head, _, tail = stem.rpartition(".")
+    return head if head and tail.isdigit() else stem
+
+def schema_for(path: Path):
+    return TABLE_SCHEMAS.get(table_name(path))
+
+def typed_read_args(schema, names):
+    """
+    read_csv dtype/parse_dates for the given column labels. names maps each label that will
+    be loaded to its header name (labels differ from names when reading with header=None).
+    """
+    # defaultdict: labels pandas invents (e.g. "Unnamed: 12") also stay str
+    dtype, parse_dates = defaultdict(lambda: str), []
+    for label, name in names.items():
+        kind = schema.get(name)
+        if kind == "timestamp":
+            parse_dates.append(label)
+        else:
+            dtype[label] = _PANDAS_DTYPES.get(kind, str)
+    return {
+        "dtype": dtype,
+        "parse_dates": parse_dates or None,
+        "date_format": SAMSUNG_TS_FORMAT if parse_dates else None,
+    }
+
+# ---------- CSV backends ----------
+# Fast engines tried in order. They run strict (on_bad_lines="error"), so a file only
+# reaches the slow python engine when it really has ragged rows. "pyarrow" may be added
+# here when installed; it is left out by default because it type-infers before casting
+# back to str (e.g. it drops the ".000" from Samsung timestamps).
+CSV_ENGINES = ["c"]
+
+def _header_names(path: Path, header):
+    rows = peek_rows(path, (header or 0) + 1)
+    return rows[header] if header is not None and len(rows) > header else []
+
+def _typed_args(path: Path, header, usecols, typed):
+    schema = schema_for(path) if typed and header is not None else None
+    if not schema:
+        return None
+    loaded = [c for c in _header_names(path, header) if usecols is None or usecols(c)]
+    return typed_read_args(schema, {c: c for c in loaded})
+
+def _is_dtype_error(e):
+    # a value that does not fit the schema dtype, as opposed to a ragged row
+    return isinstance(e, ValueError) and not isinstance(e, pd.errors.ParserError)
+
+def _read_csv(path: Path, header, usecols, on_bad_lines, typed_args, debug):
+    kind = "typed" if typed_args else "str"
+    kwargs = typed_args or {"dtype": str}
+    for engine in CSV_ENGINES:
+        try:
+            cols = usecols
+            if engine == "pyarrow" and usecols is not None:
+                # pyarrow has no callable usecols; resolve names from the header line
+                cols = [c for c in _header_names(path, header) if usecols(c)]
+            with csv_source(path) as src:
+                df = pd.read_csv(
+                    src, header=header, sep=",", engine=engine, on_bad_lines="error",
+                    usecols=cols, **kwargs,
+                )
+        except Exception as e:
+            if typed_args and _is_dtype_error(e):
+                raise
+            if debug:
+                print(f"[loaders] [DEBUG] {path.name}: engine={engine} failed ({type(e).__name__}: {str(e)[:120]})")
+            continue
+        if debug:
+            print(f"[loaders] [DEBUG] {path.name}: engine={engine}, {kind}")
+        return df
+    with csv_source(path) as src:
+        df = pd.read_csv(
+            src, header=header, sep=",", engine="python", on_bad_lines=on_bad_lines,
+            usecols=usecols, **kwargs,
+        )
+    if debug:
+        print(f"[loaders] [DEBUG] {path.name}: engine=python (fallback), {kind}")
+    return df
+
+def read_table(path: Path, header=0, columns=None, on_bad_lines="skip", typed=True, where=None, debug=False):
+    """
+    where=(column, "in" | "not in", values) keeps only the matching rows (see row_mask). The
+    filter runs on each chunk as it is parsed, so the rejected rows are never held (or cached).
+    """
+    variant = f"read_table|header={header}|columns={columns}|on_bad_lines={on_bad_lines}|typed={typed}"
+    if where:
+        variant += f"|where={where}"
+    df = table_cache.load(path, variant, debug=debug)
+    if df is None:
+        if where:
+            df = _read_filtered(path, header, columns, typed, where, debug)
+        else:
+            df = _read_table(path, header, columns, on_bad_lines, typed, debug)
+        table_cache.store(path, variant, df, debug=debug)
+    return column_cache.tag(df, f"{source_id(path)}|{variant}", table_name(path))
+
+def row_mask(df, where):
+    """
+    Boolean mask for where=(column, "in" | "not in", values). column matches like the
+    columns filter (case-insensitive substring); numeric values compare numerically, so
+    typed and str reads agree. A table without the column is not filtered.
+    """
+    column, op, values = where
+    col = next((c for c in df.columns if column.lower() in str(c).lower()), None)
+    if col is None:
+        return pd.Series(True, index=df.index)
+    vals = df[col]
+    if all(isinstance(v, (int, float)) for v in values):
+        vals = pd.to_numeric(vals, errors="coerce")
+    mask = vals.isin(list(values))
+    return ~mask if op == "not in" else mask
+
+def _read_filtered(path: Path, header, columns, typed, where, debug):
+    parts = []
+    for chunk in iter_table(path, header=header, columns=columns, typed=typed, debug=debug):
+        parts.append(chunk[row_mask(chunk, where).to_numpy()])
+    if debug:
+        kept = sum(len(p) for p in parts)
+        print(f"[loaders] [DEBUG] {path.name}: where={where} kept {kept} rows")
+    if not parts:
+        return pd.DataFrame()
+    return pd.concat(parts, ignore_index=True)
+
+def _read_table(path: Path, header, columns, on_bad_lines, typed, debug):
+    usecols = column_filter(columns)
+    typed_args = _typed_args(path, header, usecols, typed)
+    if typed_args:
+        try:
+            return _read_csv(path, header, usecols, on_bad_lines, typed_args, debug)
+        except Exception as e:
+            if debug:
+                print(f"[loaders] [DEBUG] {path.name}: typed read failed ({str(e)[:120]}); reading as str")
+    try:
+        return _read_csv(path, header, usecols, on_bad_lines, None, debug)
+    except Exception:
+        return pd.DataFrame()
+
+def iter_table(path: Path, header=0, columns=None, chunksize=500_000, typed=True, debug=False):
+    """
+    Chunked counterpart of read_table. If a strict fast engine hits a ragged row (or a typed
+    read hits a value that does not fit the schema) mid-file, the next attempt restarts the
+    read and skips the rows that were already yielded.
+    """
+    usecols = column_filter(columns)
+    typed_args = _typed_args(path, header, usecols, typed)
+    done = 0
+    engines = [(engine, "error") for engine in CSV_ENGINES if engine != "pyarrow"]
+    engines.append(("python", "skip"))
+    attempts = [(engine, bad_lines, typed_args) for engine, bad_lines in engines if typed_args]
+    attempts += [(engine, bad_lines, None) for engine, bad_lines in engines]
+    dtype_failed = False
+    for engine, bad_lines, args in attempts:
+        if args and dtype_failed:
+            continue
+        skip = done
+        try:
+            with csv_source(path) as src, pd.read_csv(
+                src, header=header, sep=",", engine=engine, on_bad_lines=bad_lines,
+                usecols=usecols, chunksize=chunksize, **(args or {"dtype": str}),
+            ) as reader:
+                for chunk in reader:
+                    if skip:
+                        if len(chunk) <= skip:
+                            skip -= len(chunk)
+                            continue
+                        chunk = chunk.iloc[skip:]
+                        skip = 0
+                    done += len(chunk)
+                    # no source tag (chunks are not column-cached), but the table is known
+                    chunk.attrs["table"] = table_name(path)
+                    yield chunk
+        except Exception as e:
+            if args and _is_dtype_error(e):
+                dtype_failed = True
+            if debug:
+                print(f"[loaders] [DEBUG] {path.name}: chunked engine={engine} stopped after {done} rows ({type(e).__name__})")
+            continue
+        if debug:
+            print(f"[loaders] [DEBUG] {path.name}: chunked engine={engine}, {done} rows")
+        return
+
+# ---------- shards ----------
+def datauuid_column(df):
+    return next((c for c in df.columns if "datauuid" in str(c).lower()), None)
+
+def load_shards(paths, load, debug=False):
+    """
+    Load every timestamp-suffixed file of one table with load(path), in parallel, and
+    concatenate them. With more than one shard, rows re-exported in several files are
+    deduplicated by datauuid, keeping the copy from the newest (last-sorted) file.
+    """
+    paths = sorted(paths, key=lambda p: p.name)
+    if not paths:
+        return pd.DataFrame()
+    if len(paths) == 1:
+        return load(paths[0])
+    with ThreadPoolExecutor(max_workers=min(len(paths), os.cpu_count() or 4)) as pool:
+        frames = [df for df in pool.map(load, paths) if not df.empty]
+    if not frames:
+        return pd.DataFrame()
+    sources = [f.attrs.get("source") for f in frames]
+    table = frames[0].attrs.get("table")
+    df = pd.concat(frames, ignore_index=True)
+    if all(sources):
+        column_cache.tag(df, "+".join(sources), table)
+    col = datauuid_column(df)
+    if col is not None:
+        before = len(df)
+        df = df[df[col].isna() | ~df[col].duplicated(keep="last")].reset_index(drop=True)
+        if all(sources):
+            column_cache.tag(df, "+".join(sources) + "|dedup", table)
+        if debug:
+            print(f"[loaders] [DEBUG] merged {len(paths)} shards: {before} rows, {len(df)} after datauuid dedup")
+    return df
+
+def drop_seen(chunk, seen):
+    """
+    Streaming counterpart of the load_shards dedup: drop rows whose datauuid is already in
+    seen (or repeats within the chunk), then record the new ones.
+    """
+    col = datauuid_column(chunk)
+    if col is None:
+        return chunk
+    keys = chunk[col]
+    fresh = keys.isna() | ~(keys.map(seen.__contains__).astype(bool) | keys.duplicated())
+    seen.update(keys[fresh].dropna())
+    return chunk[fresh]
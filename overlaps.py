@@ -0,0 +1,174 @@
+# overlaps.py
+import numpy as np
+import pandas as pd
+
+# Phone and watch both log pedometer segments, so the same walk shows up twice in
+# pedometer_step_count. Devices are ranked (explicit priority list first, then by total
+# steps) and each segment keeps only the share of its duration that no higher-ranked
+# device covers. Per rank level this is one sort + cumulative max to build the union of
+# the higher-ranked intervals, then a searchsorted over it, so O(n log n) overall and no
+# pairwise segment comparisons.
+
+_enabled = True
+_priority = []
+
+
+def configure(enabled=True, priority=None):
+    """priority: deviceuuids in preferred order; unlisted devices follow, most steps first."""
+    global _enabled, _priority
+    _enabled = enabled
+    _priority = list(priority or [])
+
+
+def enabled():
+    return _enabled
+
+
+def settings_tag():
+    """Identifies the current settings, for caches of deduplicated columns."""
+    return f"overlaps|{_enabled}|{','.join(map(str, _priority))}"
+
+
+def _device_keys(devices):
+    # rows without a deviceuuid form one "" device, so keys stay comparable across chunks
+    return devices.astype(object).where(devices.notna(), "")
+
+
+def rank_devices(totals):
+    """{device: rank} (0 = preferred) from {device: total steps}."""
+    listed = {d: i for i, d in enumerate(_priority)}
+    order = sorted(totals, key=lambda d: (listed.get(d, len(listed)), -totals[d]))
+    return {d: r for r, d in enumerate(order)}
+
+
+def _union(start, end):
+    """Sorted disjoint intervals covering all [start, end) pairs."""
+    order = np.argsort(start, kind="stable")
+    s, e = start[order], end[order]
+    reach = np.maximum.accumulate(e)
+    new = np.ones(len(s), dtype=bool)
+    new[1:] = s[1:] > reach[:-1]
+    group_end = np.flatnonzero(np.r_[new[1:], True])
+    return s[new], reach[group_end]
+
+
+def _covered(a, b, x):
+    """Length of the union [a, b) that lies before each x."""
+    lengths = b - a
+    before = np.r_[0, np.cumsum(lengths)[:-1]]
+    idx = np.searchsorted(a, x, side="right") - 1
+    at = np.maximum(idx, 0)
+    inside = np.clip(x - a[at], 0, lengths[at])
+    return np.where(idx >= 0, before[at] + inside, 0)
+
+
+def _share(start, end, cover):
+    a, b = cover
+    if not len(a):
+        return np.ones(len(start), dtype="float64")
+    return 1.0 - (_covered(a, b, end) - _covered(a, b, start)) / (end - start)
+
+
+def kept_share(start, end, ranks):
+    """
+    Fraction (0..1) of each segment not covered by a higher-ranked device. start/end are
+    int64 (e.g. ns) arrays; rows with a missing or empty interval keep everything.
+    """
+    share = np.ones(len(start), dtype="float64")
+    valid = end > start
+    cover = None  # union of all higher-ranked segments so far
+    for rank in np.unique(ranks[valid]):
+        rows = np.flatnonzero(valid & (ranks == rank))
+        s, e = start[rows], end[rows]
+        if cover is not None:
+            share[rows] = _share(s, e, cover)
+            s, e = np.r_[cover[0], s], np.r_[cover[1], e]
+        cover = _union(s, e)
+    return share
+
+
+def _kept_steps(steps, share):
+    # whole steps per segment, so totals summed in any order or chunking agree exactly
+    return np.rint(steps * share)
+
+
+def _segments(start, end, devices, steps):
+    ok = (start.notna() & end.notna()).to_numpy()
+    s = start.to_numpy()[ok].astype("datetime64[ns]").astype("int64")
+    e = end.to_numpy()[ok].astype("datetime64[ns]").astype("int64")
+    return ok, s, e, _device_keys(devices[ok]), steps.to_numpy(dtype="float64", na_value=np.nan)[ok]
+
+
+def dedup_steps(start, end, devices, steps):
+    """
+    steps with cross-device overlaps removed. start/end are UTC datetime Series (NaT
+    allowed), devices the deviceuuid Series, steps numeric; all share one index.
+    """
+    if not _enabled or len(steps) == 0 or devices.nunique(dropna=False) < 2:
+        return steps
+    ok, s, e, keys, weights = _segments(start, end, devices, steps)
+    if not ok.any():
+        return steps
+    codes, uniques = pd.factorize(keys)
+    totals = np.bincount(codes, weights=np.nan_to_num(weights), minlength=len(uniques))
+    ranks = rank_devices(dict(zip(uniques, totals)))
+    share = np.ones(len(steps), dtype="float64")
+    share[ok] = kept_share(s, e, np.array([ranks[d] for d in uniques], dtype="int64")[codes])
+    return _kept_steps(steps, share)
+
+
+# ---------- streaming ----------
+# Chunked reads see each overlap possibly split across chunks, so dedup there takes two
+# passes: collect() folds every chunk into per-device interval unions and step totals,
+# then finish() ranks the devices and stream_share() dedups each chunk of the second pass
+# against the union of all higher-ranked devices. Unions are usually far smaller than the
+# segment list, since back-to-back segments of one device merge.
+
+def new_state():
+    return {"unions": {}, "totals": {}}
+
+
+def collect(state, start, end, devices, steps):
+    ok, s, e, keys, weights = _segments(start, end, devices, steps)
+    valid = e > s
+    codes, uniques = pd.factorize(keys)
+    totals = np.bincount(codes, weights=np.nan_to_num(weights), minlength=len(uniques))
+    for code, device in enumerate(uniques):
+        state["totals"][device] = state["totals"].get(device, 0.0) + totals[code]
+        rows = valid & (codes == code)
+        if not rows.any():
+            continue
+        a, b = state["unions"].get(device, (np.empty(0, "int64"), np.empty(0, "int64")))
+        state["unions"][device] = _union(np.r_[a, s[rows]], np.r_[b, e[rows]])
+
+
+def finish(state):
+    """{"ranks": {device: rank}, "covers": {rank: union of all devices ranked above it}}."""
+    ranks = rank_devices(state["totals"])
+    covers = {}
+    cover = (np.empty(0, "int64"), np.empty(0, "int64"))
+    for device in sorted(ranks, key=ranks.get):
+        covers[ranks[device]] = cover
+        a, b = state["unions"].get(device, (np.empty(0, "int64"), np.empty(0, "int64")))
+        cover = _union(np.r_[cover[0], a], np.r_[cover[1], b])
+    return {"ranks": ranks, "covers": covers}
+
+
+def stream_share(plan, start, end, devices, steps):
+    """dedup_steps for one chunk of a two-pass read (plan from finish())."""
+    if not _enabled or len(plan["ranks"]) < 2 or len(steps) == 0:
+        return steps
+    ok, s, e, keys, _ = _segments(start, end, devices, steps)
+    codes, uniques = pd.factorize(keys)
+    ranks = np.array([plan["ranks"].get(d, len(plan["ranks"])) for d in uniques], dtype="int64")[codes]
+    share_ok = np.ones(len(s), dtype="float64")
+    valid = e > s
+    for rank in np.unique(ranks[valid]):
+        cover = plan["covers"].get(rank)
+        if cover is None:
+            continue
+        rows = np.flatnonzero(valid & (ranks == rank))
+        share_ok[rows] = _share(s[rows], e[rows], cover)
+    share = np.ones(len(steps), dtype="float64")
+    share[ok] = share_ok
+    return _kept_steps(steps, share)
@@ -0,0 +1,112 @@
+# reconcile.py
+import pandas as pd
+from timekeys import period_key, period_label, month_label
+
+# Cross-source step reconciliation over the daily cube (see steps.build_daily_cube).
+# Each source is reduced to one number per local day the same way its monthly aggregate
+# does it (day_summary: max over the day's rows, pedometer/trend: sum), then compared
+# against day_summary ("merged", the value the report trusts) column-wise.
+
+SOURCES = {"day_summary": "merged", "pedometer": "detailed", "trend": "trend"}
+COMPARED = ["detailed", "trend"]
+
+# A day is an outlier when its ratio to merged sits more than OUTLIER_MADS robust
+# standard deviations from the typical ratio and the step gap is at least MIN_DELTA.
+OUTLIER_MADS = 3.5
+MIN_DELTA = 1000
+_MAD_SCALE = 1.4826
+
+
+def daily_sources(cube):
+    """Day key x {merged, detailed, trend} step totals (NaN where a source has no rows)."""
+    if cube.empty:
+        return pd.DataFrame(columns=list(SOURCES.values()), dtype="float64")
+    is_summary = (cube["source"] == "day_summary").to_numpy()
+    merged = cube[is_summary].groupby("day")["steps"].max().rename("merged")
+    others = cube[~is_summary].groupby(["day", "source"], observed=True)["steps"].sum().unstack("source")
+    # a source with no rows would leave an empty frame concat cannot align; skip it
+    parts = [p for p in (merged.to_frame(), others.rename(columns=SOURCES)) if not p.empty]
+    out = pd.concat(parts, axis=1) if parts else pd.DataFrame(dtype="float64")
+    return out.reindex(columns=list(SOURCES.values())).astype("float64").sort_index()
+
+
+def _compare(frame):
+    for col in COMPARED:
+        frame[f"{col}_delta"] = frame[col] - frame["merged"]
+        frame[f"{col}_ratio"] = frame[col] / frame["merged"].where(frame["merged"] > 0)
+    return frame
+
+
+def _outliers(daily):
+    flags = pd.Series(False, index=daily.index)
+    for col in COMPARED:
+        ratio = daily[f"{col}_ratio"]
+        center = ratio.median()
+        spread = (ratio - center).abs().median() * _MAD_SCALE
+        if pd.isna(center):
+            continue
+        far = (ratio - center).abs() > OUTLIER_MADS * max(spread, 1e-9)
+        flags |= far & (daily[f"{col}_delta"].abs() >= MIN_DELTA)
+    return flags
+
+
+def _monthly(daily, months):
+    by_month = daily.groupby(months)
+    monthly = by_month[list(SOURCES.values())].sum(min_count=1)
+    monthly["merged_days"] = by_month["merged"].count()
+    for col in COMPARED:
+        # only days both sources cover, so a source starting mid-month is not a gap
+        both = daily["merged"].notna() & daily[col].notna()
+        covered = daily[both].groupby(months[both])
+        merged = covered["merged"].sum()
+        monthly[f"{col}_delta"] = covered[col].sum() - merged
+        monthly[f"{col}_ratio"] = covered[col].sum() / merged.where(merged > 0)
+        monthly[f"{col}_days"] = both.groupby(months).sum()
+    monthly["outlier_days"] = by_month["outlier"].sum()
+    return monthly
+
+
+def reconcile_steps(cube):
+    """
+    {"daily": per-day frame, "monthly": per-month frame}. Both carry merged/detailed/trend,
+    <source>_delta (source - merged) and <source>_ratio (source / merged); daily has an
+    "outlier" flag and monthly an "outlier_days" count. Monthly deltas and ratios cover
+    only the <source>_days days that have both merged and that source.
+    """
+    daily = _compare(daily_sources(cube))
+    # nothing to reconcile unless merged and at least one other source have values
+    if daily["merged"].isna().all() or daily[COMPARED].isna().all(axis=None):
+        return {"daily": daily, "monthly": pd.DataFrame()}
+    daily["outlier"] = _outliers(daily)
+    months = pd.Series(period_key(daily.index, "month"), index=daily.index, name="month")
+    return {"daily": daily, "monthly": _monthly(daily, months)}
+
+
+def _fmt_compare(name, ratio, delta, days, merged_days):
+    if pd.isna(ratio):
+        return None
+    partial = f", {int(days)} of {int(merged_days)} days" if days < merged_days else ""
+    return f"{name}/merged={ratio:.2f} ({int(delta):+,}{partial})"
+
+
+def format_reconciliation_section(recon, max_days=5):
+    monthly = recon.get("monthly", pd.DataFrame())
+    if monthly.empty:
+        return "=== Step reconciliation ===\nNo overlapping step sources to compare.\n"
+    daily = recon["daily"]
+    flagged = daily.index[daily["outlier"].to_numpy()]
+    flagged_months = period_key(flagged, "month")
+    lines = ["=== Step reconciliation ==="]
+    for k, row in zip(monthly.index, monthly.itertuples(index=False)):
+        parts = [
+            _fmt_compare("detailed", row.detailed_ratio, row.detailed_delta, row.detailed_days, row.merged_days),
+            _fmt_compare("trend", row.trend_ratio, row.trend_delta, row.trend_days, row.merged_days),
+        ]
+        parts = [p for p in parts if p]
+        lines.append(f"\n===== {month_label(k)} =====")
+        lines.append(", ".join(parts) if parts else "No source to compare with merged.")
+        if row.outlier_days:
+            days = [period_label(d, "day") for d in flagged[flagged_months == k]]
+            more = f", ... (+{len(days) - max_days})" if len(days) > max_days else ""
+            lines.append(f"Outlier days: {int(row.outlier_days)} ({', '.join(days[:max_days])}{more})")
+    return "\n".join(lines) + "\n"
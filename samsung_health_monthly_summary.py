@@ -2,31 +2,55 @@
 
 import sys
 import pathlib
-from steps import summarize_steps, format_steps_section
+from steps import summarize_steps, format_steps_section, format_activity_section
+from reconcile import reconcile_steps, format_reconciliation_section
 from hrv import summarize_hrv, format_hrv_section
+import overlaps
+import table_cache
+from export_fs import open_export, local_dir
 
 def main():
     args = [a for a in sys.argv[1:] if not a.startswith("--")]
     debug = "--debug" in sys.argv
+    # --chunksize=N streams pedometer_step_count in N-row chunks to bound memory
+    chunksize = next((int(a.split("=", 1)[1]) for a in sys.argv if a.startswith("--chunksize=")), None)
+    # --jobs=N caps the threads reading HRV histogram JSONs
+    jobs = next((int(a.split("=", 1)[1]) for a in sys.argv if a.startswith("--jobs=")), None)
+    # --trend-source=devices reads step_daily_trend's per-device rows instead of the combined ones
+    trend_source = next((a.split("=", 1)[1] for a in sys.argv if a.startswith("--trend-source=")), "combined")
 
     if len(args) >= 1:
-        base = pathlib.Path(args[0])
+        # a samsunghealth_*.zip is read in place, without extracting it
+        base = open_export(pathlib.Path(args[0]))
     else:
         base = pathlib.Path(__file__).resolve().parent
         print(f"[INFO] No path given; using script directory: {base}")
 
     if not base.is_dir():
-        print(f"Error: {base} is not a directory.")
+        print(f"Error: {base} is not a directory or export zip.")
         sys.exit(1)
+    out_dir = local_dir(base)
+
+    # Parsed tables are cached under the export dir; --cache-dir=PATH moves it, --no-cache skips it
+    if "--no-cache" not in sys.argv:
+        cache_dir = next((a.split("=", 1)[1] for a in sys.argv if a.startswith("--cache-dir=")), None)
+        table_cache.configure(pathlib.Path(cache_dir) if cache_dir else out_dir / ".monthly_summary_cache")
+
+    # Overlapping phone/watch pedometer segments are counted once; --keep-overlaps sums them all,
+    # --device-priority=UUID,UUID picks which device wins (default: the one with most steps)
+    priority = next((a.split("=", 1)[1].split(",") for a in sys.argv if a.startswith("--device-priority=")), None)
+    overlaps.configure(enabled="--keep-overlaps" not in sys.argv, priority=priority)
 
     sections = []
 
     # Steps
-    step_summary = summarize_steps(base, debug=debug)
+    step_summary = summarize_steps(base, debug=debug, chunksize=chunksize, trend_source=trend_source)
     sections.append(format_steps_section(step_summary))
+    sections.append(format_reconciliation_section(reconcile_steps(step_summary["cube"])))
+    sections.append(format_activity_section(step_summary))
 
     # HRV
-    hrv_summary = summarize_hrv(base, debug=debug)
+    hrv_summary = summarize_hrv(base, debug=debug, jobs=jobs)
     sections.append(format_hrv_section(hrv_summary))
 
     # Future: other modules here...
@@ -34,8 +58,8 @@ def main():
     output_text = "\n".join(sections)
     print(output_text)
     try:
-        (base / "monthly_summary.txt").write_text(output_text, encoding="utf-8")
-        print(f"Wrote summary to {base/'monthly_summary.txt'}")
+        (out_dir / "monthly_summary.txt").write_text(output_text, encoding="utf-8")
+        print(f"Wrote summary to {out_dir/'monthly_summary.txt'}")
     except Exception as e:
         print(f"Failed to write summary: {e}")
 
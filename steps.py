@@ -1,11 +1,47 @@
 # steps.py
+import re
+import numpy as np
 import pandas as pd
 from pathlib import Path
+import column_cache
+import overlaps
+import table_cache
+from column_cache import cached_column
+from export_fs import csv_source, source_id
+from timekeys import month_key, day_key, month_label, period_key
+from loaders import (
+    sniff_header_row, read_table, iter_table, column_filter, schema_for, typed_read_args, load_shards, drop_seen,
+    table_name, SAMSUNG_TS_FORMAT,
+)
 
 # ---------- helpers ----------
-def clean_ts(series):
-    series = series.copy()
-    ts = pd.Series([pd.NaT] * len(series))
+EPOCH_MS = "epoch_ms"
+TS_FORMATS = [SAMSUNG_TS_FORMAT, "%Y-%m-%d %H:%M:%S", "ISO8601"]
+# (table, column) -> detected timestamp format, reused across files (and shards) of the same table
+_ts_format_cache = {}
+
+def _detect_ts_format(series, sample_size=200):
+    sample = series.dropna().head(sample_size * 4).astype(str).str.strip()
+    sample = sample[sample != ""].head(sample_size)
+    if sample.empty:
+        return None
+    if sample.str.fullmatch(r"-?\d+(\.\d+)?").all():
+        return EPOCH_MS
+    for fmt in TS_FORMATS:
+        if _parse_ts(sample, fmt).notna().all():
+            return fmt
+    return None
+
+def _parse_ts(series, fmt):
+    if fmt == EPOCH_MS:
+        return pd.to_datetime(pd.to_numeric(series, errors="coerce"), unit="ms", errors="coerce")
+    if fmt == "ISO8601":
+        # values may mix "Z"/offset suffixes with naive times; read all as UTC, kept naive
+        return pd.to_datetime(series, format=fmt, errors="coerce", utc=True).dt.tz_localize(None)
+    return pd.to_datetime(series, format=fmt, errors="coerce")
+
+def _clean_ts_generic(series):
+    ts = pd.Series(pd.NaT, index=series.index, dtype="datetime64[ns]")
     num = pd.to_numeric(series, errors="coerce")
     if num.notna().any():
         candidate = pd.to_datetime(num, unit="ms", errors="coerce")
@@ -18,60 +54,99 @@ def clean_ts(series):
                 ts = parsed
         except Exception:
             pass
+    return ts
+
+def _unparsed(series, ts):
+    """True if ts left any non-empty value of series unparsed."""
+    miss = ts.isna() & series.notna()
+    return bool(miss.any()) and bool(series[miss].astype(str).str.strip().ne("").any())
+
+def clean_ts(series, table=None):
+    if pd.api.types.is_datetime64_any_dtype(series):
+        # already parsed by a typed (schema-aware) load
+        ts = series
+    elif pd.api.types.is_numeric_dtype(series):
+        ts = pd.to_datetime(series, unit="ms", errors="coerce")
+    else:
+        # one explicit-format vectorized parse; format detected from a small sample
+        # (or taken from an earlier file of the same table)
+        key = (table, series.name) if table and series.name is not None else None
+        fmt = _ts_format_cache.get(key) if key else None
+        ts = _parse_ts(series, fmt) if fmt else None
+        if ts is not None and _unparsed(series, ts):
+            # this file does not fully fit the cached format; detect afresh
+            _ts_format_cache.pop(key, None)
+            ts = None
+        if ts is None:
+            fmt = _detect_ts_format(series)
+            ts = _parse_ts(series, fmt) if fmt else None
+            if ts is None or (ts.isna().all() and series.notna().any()):
+                ts = _clean_ts_generic(series)
+            elif key is not None and not _unparsed(series, ts):
+                _ts_format_cache[key] = fmt
     return ts.where(ts.dt.year >= 2005, pd.NaT)
 
-def smart_load(path, expect=None, debug=False):
+_OFFSET_RE = re.compile(r"UTC([+-])(\d{1,2}):?(\d{2})")
+
+def _offset_ns(value):
+    m = _OFFSET_RE.fullmatch(str(value).strip())
+    if not m:
+        return 0
+    sign = -1 if m.group(1) == "-" else 1
+    return sign * (int(m.group(2)) * 3600 + int(m.group(3)) * 60) * 1_000_000_000
+
+def to_local_time(ts, offsets):
+    """
+    Shift UTC timestamps by Samsung's per-row time_offset ("UTC+0900"). Only the distinct
+    offsets are parsed; the shift itself is one int64 add over the column. Rows with a
+    missing or unparseable offset stay in UTC.
+    """
+    codes, uniques = pd.factorize(offsets)
+    deltas = np.array([_offset_ns(u) for u in uniques] + [0], dtype="int64")
+    return ts + pd.to_timedelta(deltas[codes], unit="ns")
+
+def _numeric(series):
+    return pd.to_numeric(series, errors="coerce")
+
+def ts_column(df, col):
+    """clean_ts(df[col]), shared through the column cache."""
+    return cached_column(df, col, "clean_ts", lambda s: clean_ts(s, table=df.attrs.get("table")))
+
+def epoch_ts_column(df, col):
+    return cached_column(df, col, "clean_ts_epoch", lambda s: clean_ts(_numeric(s)))
+
+def numeric_column(df, col):
+    return cached_column(df, col, "to_numeric", _numeric)
+
+def local_ts_column(df, col, offset_col):
+    """ts_column(df, col) shifted by df[offset_col] (see to_local_time), also cached."""
+    return cached_column(df, col, f"local_time|{offset_col}", lambda s: to_local_time(ts_column(df, col), df[offset_col]))
+
+def smart_load(path, expect=None, columns=None, where=None, debug=False):
     if not path.exists():
         if debug:
             print(f"[steps] [DEBUG] missing {path.name}")
         return pd.DataFrame()
-    def try_read(h):
-        try:
-            return pd.read_csv(
-                path, header=h, sep=",", engine="python", dtype=str, on_bad_lines="skip"
-            )
-        except Exception:
-            return pd.DataFrame()
-    df0 = try_read(0)
-    df1 = try_read(1)
-    pick = df0
-    if expect:
-        has1 = any(e.lower() in " ".join(str(c).lower() for c in df1.columns) for e in expect)
-        has0 = any(e.lower() in " ".join(str(c).lower() for c in df0.columns) for e in expect)
-        if has1 and (not has0 or len(df1.columns) >= len(df0.columns)):
-            pick = df1
-    else:
-        if len(df1.columns) > len(df0.columns):
-            pick = df1
+    hdr = sniff_header_row(path, expect=expect)
+    pick = read_table(path, header=hdr, columns=columns, where=where, debug=debug)
     if debug:
-        hdr = "1" if pick is df1 else "0"
         print(f"[steps] [DEBUG] Loading {path.name}: header={hdr}, shape={pick.shape}")
         print(f"[steps] [DEBUG] Columns (first 20): {list(pick.columns)[:20]}")
         with pd.option_context("display.max_columns", None, "display.width", 220):
             print(f"[steps] [DEBUG] Sample:\n{pick.head(2).to_string(index=False)}")
     return pick
 
-def load_day_summary_manual(path, debug=False):
+def load_day_summary_manual(path, columns=None, debug=False):
     if not path.exists():
         if debug:
             print(f"[steps] [DEBUG] day_summary file missing: {path}")
         return pd.DataFrame()
-    with open(path, encoding="utf-8", errors="ignore") as f:
-        lines = f.read().splitlines()
-    if len(lines) < 2:
-        return pd.DataFrame()
-    header = lines[1].split(",")
-    records = []
-    for line in lines[2:]:
-        if not line.strip():
-            continue
-        parts = line.split(",")
-        if len(parts) > len(header):
-            parts = parts[: len(header)]
-        if len(parts) < len(header):
-            parts += [""] * (len(header) - len(parts))
-        records.append(dict(zip(header, parts)))
-    df = pd.DataFrame.from_records(records)
+    variant = f"day_summary|columns={columns}"
+    df = table_cache.load(path, variant, debug=debug)
+    if df is None:
+        df = _read_day_summary(path, columns, debug)
+        table_cache.store(path, variant, df, debug=debug)
+    column_cache.tag(df, f"{source_id(path)}|{variant}", table_name(path))
     if debug:
         print(f"[steps] [DEBUG] Loaded day_summary manually: shape={df.shape}")
         with pd.option_context("display.max_columns", None, "display.width", 220):
@@ -79,82 +154,409 @@ def load_day_summary_manual(path, debug=False):
             print(f"[steps] [DEBUG] Sample:\n{df.head(2).to_string(index=False)}")
     return df
 
+def _read_day_summary(path, columns, debug):
+    with path.open("r", encoding="utf-8", errors="ignore") as f:
+        f.readline()
+        header_line = f.readline()
+    if not header_line:
+        return pd.DataFrame()
+    header = header_line.rstrip("\r\n").split(",")
+    wanted = column_filter(columns)
+    # name -> index of its last occurrence (later duplicates win, as with a dict per row)
+    positions = {}
+    for i, name in enumerate(header):
+        if wanted is None or wanted(name):
+            positions[name] = i
+    if not positions:
+        return pd.DataFrame()
+    # Fixing the field count via names pads short rows with "" and drops extra trailing fields,
+    # which is what lets the C parser read Samsung's ragged day_summary rows.
+    def read(typed_args):
+        with csv_source(path) as src:
+            return pd.read_csv(
+                src, header=None, skiprows=2, names=range(len(header)), usecols=sorted(positions.values()),
+                sep=",", engine="c", encoding_errors="ignore", **typed_args,
+            )
+    schema = schema_for(path)
+    df = None
+    if schema:
+        typed_args = typed_read_args(schema, {i: name for name, i in positions.items()})
+        try:
+            df = read(typed_args)
+            str_cols = [i for i, kind in typed_args["dtype"].items() if kind is str]
+            df[str_cols] = df[str_cols].fillna("")
+        except Exception as e:
+            if debug:
+                print(f"[steps] [DEBUG] typed day_summary read failed ({str(e)[:120]}); reading as str")
+            df = None
+    if df is None:
+        try:
+            df = read({"dtype": str, "na_filter": False})
+        except Exception as e:
+            # e.g. a first data row with more fields than the header: read_csv then rejects
+            # the names outright, so split the lines by hand like the original loader did
+            if debug:
+                print(f"[steps] [DEBUG] day_summary read_csv failed ({str(e)[:120]}); splitting lines")
+            return _split_day_summary(path, len(header), positions)
+    df = df[list(positions.values())]
+    df.columns = list(positions.keys())
+    return df
+
+def _split_day_summary(path, width, positions):
+    """Plain line splitter: rows padded with "" / truncated to the header width, all str."""
+    rows = []
+    with path.open("r", encoding="utf-8", errors="ignore") as f:
+        for i, line in enumerate(f):
+            if i < 2 or not line.strip():
+                continue
+            parts = line.rstrip("\r\n").split(",")[:width]
+            parts += [""] * (width - len(parts))
+            rows.append([parts[j] for j in positions.values()])
+    return pd.DataFrame(rows, columns=list(positions.keys()), dtype=str)
+
 # ---------- aggregators ----------
+# Column-name substrings each aggregator looks up; loaders parse only matching columns.
+# datauuid is carried along so rows repeated across export shards can be deduplicated.
+# time_offset lets start_time-based buckets use the wearer's local day/month.
+# deviceuuid, distance and calorie feed the daily cube; end_time + deviceuuid also drive
+# the cross-device overlap dedup of pedometer segments (see overlaps.py).
+DAY_SUMMARY_COLUMNS = ["step_count", "day_time", "start_time", "time_offset", "datauuid", "deviceuuid", "distance", "calorie"]
+PEDOMETER_COLUMNS = ["start_time", "end_time", "run_step", "walk_step", "count", "time_offset", "datauuid", "deviceuuid", "distance", "calorie"]
+TREND_COLUMNS = ["day_time", "count", "datauuid", "deviceuuid", "distance", "calorie", "source_type"]
+
+# step_daily_trend holds one row per device per day plus Samsung's combined row
+# (source_type -2); summing both double counts. The filter is applied while reading.
+TREND_COMBINED = -2
+TREND_SOURCES = {
+    "combined": ("source_type", "in", (TREND_COMBINED,)),
+    "devices": ("source_type", "not in", (TREND_COMBINED,)),
+}
+
+def _find_column(df, needle):
+    return next((c for c in df.columns if needle in c.lower()), None)
+
+def _day_summary_values(df):
+    """(local ts, steps) Series of a day_summary table, or None if it lacks the columns."""
+    step_col = _find_column(df, "step_count")
+    if step_col is None:
+        return None
+    steps = numeric_column(df, step_col)
+    if "day_time" in df.columns:
+        return epoch_ts_column(df, "day_time"), steps
+    # day_time is already the local day; start_time is UTC and needs the offset
+    fallback = _find_column(df, "start_time")
+    if fallback is None:
+        return None
+    offset_col = _find_column(df, "time_offset")
+    ts = local_ts_column(df, fallback, offset_col) if offset_col else ts_column(df, fallback)
+    return ts, steps
+
+def _pedometer_values(df, dedup=True):
+    """
+    (local ts, steps) Series of a pedometer_step_count table, or None. With dedup, steps
+    that a higher-ranked device also logged over the same interval are dropped.
+    """
+    ts_col = _find_column(df, "start_time")
+    if ts_col is None:
+        return None
+    offset_col = _find_column(df, "time_offset")
+    ts = local_ts_column(df, ts_col, offset_col) if offset_col else ts_column(df, ts_col)
+    run_col = _find_column(df, "run_step")
+    walk_col = _find_column(df, "walk_step")
+    if run_col or walk_col:
+        run_vals = numeric_column(df, run_col) if run_col else pd.Series(0, index=df.index)
+        walk_vals = numeric_column(df, walk_col) if walk_col else pd.Series(0, index=df.index)
+        steps = run_vals.fillna(0) + walk_vals.fillna(0)
+    else:
+        count_col = _find_column(df, "count")
+        if count_col is None:
+            return None
+        steps = numeric_column(df, count_col)
+    return ts, (_dedup_overlaps(df, steps) if dedup else steps)
+
+def _segment_columns(df):
+    """(start, end, deviceuuid) column names, or None when the table lacks one of them."""
+    cols = tuple(_find_column(df, n) for n in ("start_time", "end_time", "deviceuuid"))
+    return None if None in cols else cols
+
+def _dedup_overlaps(df, steps):
+    """steps minus what another (higher-ranked) device logged over the same interval."""
+    cols = _segment_columns(df)
+    if not overlaps.enabled() or cols is None:
+        return steps
+    start_col, end_col, device_col = cols
+    return cached_column(
+        df, start_col, overlaps.settings_tag(),
+        lambda s: overlaps.dedup_steps(ts_column(df, start_col), ts_column(df, end_col), df[device_col], steps),
+    )
+
+def _trend_values(df):
+    """(ts, steps) Series of a step_daily_trend table, or None."""
+    ts_col = _find_column(df, "day_time")
+    count_col = _find_column(df, "count")
+    if ts_col is None or count_col is None:
+        return None
+    return epoch_ts_column(df, ts_col), numeric_column(df, count_col)
+
 def aggregate_day_summary(df):
     if df.empty:
         return pd.DataFrame()
-    df = df.copy()
-    step_col = next((c for c in df.columns if "step_count" in c.lower()), None)
-    if step_col is None:
+    values = _day_summary_values(df)
+    if values is None:
         return pd.DataFrame()
-    df["step_val"] = pd.to_numeric(df[step_col], errors="coerce")
-    if "day_time" in df.columns:
-        df["ts"] = clean_ts(pd.to_numeric(df["day_time"], errors="coerce"))
-    else:
-        fallback = next((c for c in df.columns if "start_time" in c.lower()), None)
-        if fallback is None:
-            return pd.DataFrame()
-        df["ts"] = clean_ts(df[fallback])
+    df = df.copy()
+    df["ts"], df["step_val"] = values
     df = df.dropna(subset=["step_val", "ts"])
     if df.empty:
         return pd.DataFrame()
+    # One hash groupby keeps the max steps per day_time (no sort), one more rolls the
+    # days up per integer month key.
+    keys = pd.DataFrame({
+        "steps": df["step_val"].to_numpy(),
+        "month": month_key(df["ts"]).to_numpy(),
+        "day": day_key(df["ts"]).to_numpy(),
+    })
     if "day_time" in df.columns:
-        df = (
-            df.sort_values(["day_time", "step_val"], ascending=[True, False])
-            .drop_duplicates("day_time", keep="first")
+        keys["day_time"] = df["day_time"].to_numpy()
+        keys = keys.groupby("day_time", sort=False).agg(
+            steps=("steps", "max"), month=("month", "first"), day=("day", "first")
         )
-    df["month"] = df["ts"].dt.to_period("M")
-    df["day"] = df["ts"].dt.normalize()
-    total = df.groupby("month")["step_val"].sum().rename("merged")
-    days = df.groupby("month")["day"].nunique()
-    avg = (total / days).round(1).rename("avg_daily")
-    return pd.concat([total, avg], axis=1)
+    out = keys.groupby("month").agg(merged=("steps", "sum"), days=("day", "nunique"))
+    out["avg_daily"] = (out["merged"] / out["days"]).round(1)
+    return out[["merged", "avg_daily"]]
 
 def aggregate_pedometer_detailed(df):
     if df.empty:
         return pd.Series(dtype=float)
-    df = df.copy()
-    ts_col = next((c for c in df.columns if "start_time" in c.lower()), None)
-    if ts_col is None:
+    values = _pedometer_values(df)
+    if values is None:
         return pd.Series(dtype=float)
-    df["ts"] = clean_ts(df[ts_col])
-    run_col = next((c for c in df.columns if "run_step" in c.lower()), None)
-    walk_col = next((c for c in df.columns if "walk_step" in c.lower()), None)
-    if run_col or walk_col:
-        run_vals = pd.to_numeric(df[run_col], errors="coerce") if run_col else pd.Series(0, index=df.index)
-        walk_vals = pd.to_numeric(df[walk_col], errors="coerce") if walk_col else pd.Series(0, index=df.index)
-        df["steps"] = run_vals.fillna(0) + walk_vals.fillna(0)
-    else:
-        count_col = next((c for c in df.columns if "count" in c.lower()), None)
-        if count_col is None:
-            return pd.Series(dtype=float)
-        df["steps"] = pd.to_numeric(df[count_col], errors="coerce")
+    df = df.copy()
+    df["ts"], df["steps"] = values
     df = df.dropna(subset=["steps", "ts"])
     if df.empty:
         return pd.Series(dtype=float)
-    df["month"] = df["ts"].dt.to_period("M")
+    df["month"] = month_key(df["ts"])
     return df.groupby("month")["steps"].sum().rename("detailed")
 
+WEEKDAYS = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+_MINUTES_PER_DAY = 24 * 60
+
+def aggregate_pedometer_heatmap(df, slot_minutes=60):
+    """
+    Steps per month x weekday x time-of-day slot (local time), from the timestamps and
+    counts already converted for aggregate_pedometer_detailed. Returns a DataFrame indexed
+    by int month key with one column per weekday * slot (column = weekday * slots_per_day
+    + slot, Monday = 0); partial results for the same slot_minutes can simply be summed.
+    """
+    values = _pedometer_values(df) if not df.empty else None
+    if values is None:
+        return _empty_heatmap(slot_minutes)
+    return _heatmap(*values, slot_minutes=slot_minutes)
+
+def _empty_heatmap(slot_minutes):
+    return pd.DataFrame(columns=range(7 * (_MINUTES_PER_DAY // slot_minutes)), dtype="float64")
+
+def _heatmap(ts, steps, slot_minutes=60):
+    # integer binning on the datetime64 values plus one np.bincount; no datetime groupby
+    slots = _MINUTES_PER_DAY // slot_minutes
+    ok = (ts.notna() & steps.notna()).to_numpy()
+    if not ok.any():
+        return _empty_heatmap(slot_minutes)
+    minutes = ts.to_numpy()[ok].astype("datetime64[m]").astype("int64")
+    weights = steps.to_numpy(dtype="float64", na_value=np.nan)[ok]
+    days = minutes // _MINUTES_PER_DAY
+    slot = (minutes - days * _MINUTES_PER_DAY) // slot_minutes
+    weekday = (days + 3) % 7  # 1970-01-01 was a Thursday
+    months, month_idx = np.unique(period_key(days, "month"), return_inverse=True)
+    bins = (month_idx * 7 + weekday) * slots + slot
+    counts = np.bincount(bins, weights=weights, minlength=len(months) * 7 * slots)
+    return pd.DataFrame(counts.reshape(len(months), 7 * slots), index=pd.Index(months, name="month"))
+
+def aggregate_pedometer_streaming(paths, chunksize=500_000, debug=False):
+    """
+    Same result as aggregate_pedometer_detailed over load_shards(paths), but reads each CSV
+    in chunks (see pedometer_cube_streaming), so memory stays bounded by chunksize.
+    """
+    cube = pedometer_cube_streaming(paths, chunksize=chunksize, debug=debug)
+    return _cube_monthly(cube, "pedometer", "detailed")
+
 def aggregate_trend(df):
     if df.empty:
         return pd.Series(dtype=float)
-    df = df.copy()
-    ts_col = next((c for c in df.columns if "day_time" in c.lower()), None)
-    if ts_col is None:
-        return pd.Series(dtype=float)
-    df["ts"] = clean_ts(pd.to_numeric(df[ts_col], errors="coerce"))
-    count_col = next((c for c in df.columns if "count" in c.lower()), None)
-    if count_col is None:
+    values = _trend_values(df)
+    if values is None:
         return pd.Series(dtype=float)
-    df["steps"] = pd.to_numeric(df[count_col], errors="coerce")
+    df = df.copy()
+    df["ts"], df["steps"] = values
     df = df.dropna(subset=["steps", "ts"])
     if df.empty:
         return pd.Series(dtype=float)
-    df["month"] = df["ts"].dt.to_period("M")
+    df["month"] = month_key(df["ts"])
     return df.groupby("month")["steps"].sum().rename("trend")
 
+# ---------- daily cube ----------
+CUBE_MEASURES = ["steps", "distance", "calories"]
+CUBE_COLUMNS = ["day", "deviceuuid", "source"] + CUBE_MEASURES
+
+def _cube_part(df, values, source, how):
+    """
+    One row per (day key, deviceuuid) for one source table. how is the reduction for rows
+    that share a day and device: "max" for day_summary (repeated daily totals, as in
+    aggregate_day_summary), "sum" for pedometer segments and trend rows.
+    """
+    if df.empty:
+        return pd.DataFrame(columns=CUBE_COLUMNS)
+    vals = values(df)
+    if vals is None:
+        return pd.DataFrame(columns=CUBE_COLUMNS)
+    ts, steps = vals
+    device_col = _find_column(df, "deviceuuid")
+    distance_col = _find_column(df, "distance")
+    calorie_col = _find_column(df, "calorie")
+    part = pd.DataFrame({
+        "ts": ts,
+        "deviceuuid": df[device_col] if device_col else None,
+        "steps": steps.astype("float64"),
+        "distance": numeric_column(df, distance_col).astype("float64") if distance_col else np.nan,
+        "calories": numeric_column(df, calorie_col).astype("float64") if calorie_col else np.nan,
+    })
+    part = part[part["ts"].notna() & part["steps"].notna()]
+    part["day"] = day_key(part["ts"])
+    grouped = part.groupby(["day", "deviceuuid"], dropna=False, sort=False)[CUBE_MEASURES]
+    # min_count=1: a day with no distance/calorie values stays NaN rather than 0.0
+    part = (grouped.sum(min_count=1) if how == "sum" else grouped.agg(how)).reset_index()
+    part["source"] = source
+    return part[CUBE_COLUMNS]
+
+def _concat_cube(parts):
+    parts = [p for p in parts if not p.empty]
+    if not parts:
+        return pd.DataFrame(columns=CUBE_COLUMNS)
+    cube = pd.concat(parts, ignore_index=True)
+    cube["day"] = cube["day"].astype("int32")
+    cube["source"] = cube["source"].astype("category")
+    return cube
+
+def build_daily_cube(ped, day, trn):
+    """
+    Compact daily step cube: one row per (day, deviceuuid, source) with steps, distance
+    and calories. day is the int day key of the local day (see timekeys); source is
+    "day_summary", "pedometer" or "trend". Weekly, monthly, yearly or per-device views
+    come from rollup_steps without touching the raw tables again.
+    """
+    return _concat_cube([
+        _cube_part(day, _day_summary_values, "day_summary", "max"),
+        _cube_part(ped, _pedometer_values, "pedometer", "sum"),
+        _cube_part(trn, _trend_values, "trend", "sum"),
+    ])
+
+def pedometer_cube_streaming(paths, chunksize=500_000, debug=False):
+    """Pedometer slice of the daily cube, read chunk by chunk (see stream_pedometer)."""
+    return stream_pedometer(paths, chunksize=chunksize, debug=debug)["cube"]
+
+def _pedometer_chunks(paths, chunksize, debug=False):
+    # newest shard first, so keeping the first copy of a datauuid matches load_shards
+    paths = sorted(paths, key=lambda p: p.name, reverse=True)
+    seen = set() if len(paths) > 1 else None
+    for path in paths:
+        if not path.exists():
+            if debug:
+                print(f"[steps] [DEBUG] missing {path.name}")
+            continue
+        hdr = sniff_header_row(path, expect=["run_step", "walk_step"])
+        rows = 0
+        for chunk in iter_table(path, header=hdr, columns=PEDOMETER_COLUMNS, chunksize=chunksize, debug=debug):
+            rows += len(chunk)
+            if seen is not None:
+                chunk = drop_seen(chunk, seen)
+            if not chunk.empty:
+                yield chunk
+        if debug:
+            print(f"[steps] [DEBUG] Streamed {path.name}: header={hdr}, rows={rows}")
+
+def _overlap_plan(paths, chunksize, debug=False):
+    """First pass of a streamed overlap dedup (see overlaps.collect), or None if not needed."""
+    state = overlaps.new_state()
+    for chunk in _pedometer_chunks(paths, chunksize, debug=debug):
+        cols = _segment_columns(chunk)
+        values = _pedometer_values(chunk, dedup=False)
+        if cols is None or values is None:
+            return None
+        start_col, end_col, device_col = cols
+        overlaps.collect(state, ts_column(chunk, start_col), ts_column(chunk, end_col), chunk[device_col], values[1])
+    plan = overlaps.finish(state)
+    if debug:
+        print(f"[steps] [DEBUG] Overlap dedup device ranks: {plan['ranks']}")
+    return plan if len(plan["ranks"]) > 1 else None
+
+def stream_pedometer(paths, chunksize=500_000, slot_minutes=60, debug=False):
+    """
+    Pedometer slice of the daily cube plus the activity heatmap, built chunk by chunk:
+    per-(day, device) and per-slot partial sums are merged at the end, so memory stays
+    bounded by chunksize and the day x device count (plus the datauuids seen so far when
+    there are several shards). Overlap dedup needs the device interval unions first, so
+    with it enabled the files are read twice.
+    """
+    plan = _overlap_plan(paths, chunksize, debug=debug) if overlaps.enabled() else None
+    parts = []
+    heat_parts = []
+    for chunk in _pedometer_chunks(paths, chunksize, debug=debug):
+        values = _pedometer_values(chunk, dedup=False)
+        if values is None:
+            continue
+        if plan is not None:
+            start_col, end_col, device_col = _segment_columns(chunk)
+            steps = overlaps.stream_share(plan, ts_column(chunk, start_col), ts_column(chunk, end_col), chunk[device_col], values[1])
+            values = (values[0], steps)
+        # chunks are not in the column cache, so convert once for both partials
+        parts.append(_cube_part(chunk, lambda _: values, "pedometer", "sum"))
+        heat_parts.append(_heatmap(*values, slot_minutes=slot_minutes))
+    heatmap = pd.concat(heat_parts).groupby(level=0).sum() if heat_parts else _empty_heatmap(slot_minutes)
+    cube = _concat_cube(parts)
+    if not cube.empty:
+        cube = (
+            cube.groupby(["day", "deviceuuid", "source"], dropna=False, observed=True, sort=False)[CUBE_MEASURES]
+            .sum(min_count=1)
+            .reset_index()
+        )[CUBE_COLUMNS]
+    return {"cube": cube, "heatmap": heatmap}
+
+def rollup_steps(cube, period="month", by_device=False):
+    """
+    Totals of the daily cube per period ("day", "week", "month" or "year") and source,
+    optionally split by device. Index levels are the integer keys from timekeys.period_key.
+    """
+    if cube.empty:
+        return pd.DataFrame(columns=CUBE_MEASURES)
+    keys = [pd.Series(period_key(cube["day"], period), index=cube.index, name=period), "source"]
+    if by_device:
+        keys.append("deviceuuid")
+    return cube.groupby(keys, dropna=False, observed=True)[CUBE_MEASURES].sum(min_count=1)
+
+def _cube_monthly(cube, source, name):
+    part = cube[cube["source"] == source] if not cube.empty else cube
+    if part.empty:
+        return pd.Series(dtype=float)
+    months = pd.Series(period_key(part["day"], "month"), index=part.index, name="month")
+    return part.groupby(months)["steps"].sum().rename(name)
+
 # ---------- public interface ----------
-def summarize_steps(base_path: Path, debug=False):
+def load_trend(paths, source="combined", debug=False):
+    """
+    step_daily_trend rows of one kind (see TREND_SOURCES). Exports without combined rows
+    fall back to the per-device rows, so the trend column does not go missing.
+    """
+    def load(where):
+        return load_shards(paths, lambda p: smart_load(p, expect=["count"], columns=TREND_COLUMNS, where=where, debug=debug), debug=debug)
+    trn = load(TREND_SOURCES[source])
+    if trn.empty and source == "combined":
+        if debug:
+            print("[steps] [DEBUG] No combined step_daily_trend rows; using per-device rows")
+        trn = load(TREND_SOURCES["devices"])
+    return trn
+
+def summarize_steps(base_path: Path, debug=False, chunksize=None, trend_source="combined"):
     # Use glob patterns to find files with any timestamp
     ped_files = list(base_path.glob("com.samsung.shealth.tracker.pedometer_step_count.*.csv"))
     day_files = list(base_path.glob("com.samsung.shealth.tracker.pedometer_day_summary.*.csv"))
@@ -166,66 +568,95 @@ def summarize_steps(base_path: Path, debug=False):
         print(f"[steps] [DEBUG] Found trend files: {[f.name for f in trn_files]}")
         print(f"[steps] [DEBUG] Base path: {base_path}")
 
-    # Use the first (or most recent) file found, or create empty path if none found
-    ped_path = ped_files[0] if ped_files else base_path / "nonexistent.csv"
-    day_path = day_files[0] if day_files else base_path / "nonexistent.csv"
-    trn_path = trn_files[0] if trn_files else base_path / "nonexistent.csv"
-
-    ped = smart_load(ped_path, expect=["run_step", "walk_step"], debug=debug)
-    day = load_day_summary_manual(day_path, debug=debug)
-    trn = smart_load(trn_path, expect=["count"], debug=debug)
+    # chunksize switches pedometer_step_count (the largest table) to the streaming path
+    if chunksize:
+        ped = pd.DataFrame()
+        streamed = stream_pedometer(ped_files, chunksize=chunksize, debug=debug)
+        ped_cube = streamed["cube"]
+        detailed = _cube_monthly(ped_cube, "pedometer", "detailed")
+        heatmap = streamed["heatmap"]
+    else:
+        ped = load_shards(
+            ped_files,
+            lambda p: smart_load(p, expect=["run_step", "walk_step"], columns=PEDOMETER_COLUMNS, debug=debug),
+            debug=debug,
+        )
+        ped_cube = None
+        detailed = aggregate_pedometer_detailed(ped)  # Series
+        heatmap = aggregate_pedometer_heatmap(ped)  # reuses detailed's converted columns
+    day = load_shards(day_files, lambda p: load_day_summary_manual(p, columns=DAY_SUMMARY_COLUMNS, debug=debug), debug=debug)
+    trn = load_trend(trn_files, source=trend_source, debug=debug)
 
     merged = aggregate_day_summary(day)  # DataFrame with merged + avg_daily
-    detailed = aggregate_pedometer_detailed(ped)  # Series
     trend = aggregate_trend(trn)  # Series
+    # timestamps/counts were already converted above; the cube reuses them via the column cache
+    cube = build_daily_cube(ped, day, trn)
+    if ped_cube is not None:
+        cube = _concat_cube([cube, ped_cube])
+    if debug:
+        print(f"[steps] [DEBUG] Daily cube: {len(cube)} rows")
 
     return {
         "merged": merged,        # DataFrame
         "detailed": detailed,    # Series
         "trend": trend,          # Series
+        "cube": cube,            # DataFrame: day x deviceuuid x source (see build_daily_cube)
+        "heatmap": heatmap,      # DataFrame: month x (weekday * 24 + hour)
     }
 
+def _steps_frame(merged, detailed, trend):
+    """Outer-join the three monthly sources on the int month key (NaN where a source has no row)."""
+    parts = []
+    if isinstance(merged, pd.DataFrame) and not merged.empty:
+        parts.append(merged[["merged", "avg_daily"]])
+    if isinstance(detailed, pd.Series) and not detailed.empty:
+        parts.append(detailed.rename("detailed"))
+    if isinstance(trend, pd.Series) and not trend.empty:
+        parts.append(trend.rename("trend"))
+    frame = pd.concat(parts, axis=1, join="outer").sort_index() if parts else pd.DataFrame()
+    # nullable Int64/Float64 sources leave pd.NA in months they do not cover; plain floats keep NaN
+    return frame.reindex(columns=["merged", "avg_daily", "detailed", "trend"]).astype("float64")
+
+def _fmt_count(v):
+    return f"{round(v):,}"
+
 def format_steps_section(summary_dict):
-    merged = summary_dict.get("merged", pd.DataFrame())
-    detailed = summary_dict.get("detailed", pd.Series(dtype=float))
-    trend = summary_dict.get("trend", pd.Series(dtype=float))
-
-    # Collect months present across sources
-    months = set()
-    if isinstance(merged, pd.DataFrame):
-        months.update(str(m) for m in merged.index)
-    if isinstance(detailed, pd.Series):
-        months.update(str(m) for m in detailed.index)
-    if isinstance(trend, pd.Series):
-        months.update(str(m) for m in trend.index)
-    if not months:
+    frame = _steps_frame(
+        summary_dict.get("merged", pd.DataFrame()),
+        summary_dict.get("detailed", pd.Series(dtype=float)),
+        summary_dict.get("trend", pd.Series(dtype=float)),
+    )
+    if frame.empty:
         return "=== Steps ===\nNo step data found.\n"
 
-    months = sorted(months)
+    # best authoritative value: merged > detailed > trend
+    has = frame[["merged", "detailed", "trend"]].notna()
+    best = frame["merged"].where(has["merged"], frame["detailed"].where(has["detailed"], frame["trend"]))
+
     lines = ["=== Steps ==="]
-    for m in months:
-        p = pd.Period(m)
-        # best authoritative value: merged > detailed > trend
-        best = None
-        avg = "?"
-        if isinstance(merged, pd.DataFrame) and p in merged.index:
-            best = merged.loc[p, "merged"]
-            avg = merged.loc[p, "avg_daily"]
-        elif isinstance(detailed, pd.Series) and p in detailed.index:
-            best = detailed.loc[p]
-        elif isinstance(trend, pd.Series) and p in trend.index:
-            best = trend.loc[p]
-
-        best_fmt = "?" if best is None or pd.isna(best) else f"{int(best):,}"
-        lines.append(f"\n===== {m} =====")
+    for k, b, m, avg, d, t in zip(frame.index, best, frame["merged"], frame["avg_daily"], frame["detailed"], frame["trend"]):
+        avg = avg if pd.notna(m) else "?"
+        best_fmt = "?" if pd.isna(b) else _fmt_count(b)
+        lines.append(f"\n===== {month_label(k)} =====")
         lines.append(f"Steps: {best_fmt}, avg/day ~{avg}")
-        comps = []
-        if isinstance(merged, pd.DataFrame) and p in merged.index:
-            comps.append(f"merged={int(merged.loc[p,'merged']):,}")
-        if isinstance(detailed, pd.Series) and p in detailed.index:
-            comps.append(f"detailed={int(detailed.loc[p]):,}")
-        if isinstance(trend, pd.Series) and p in trend.index:
-            comps.append(f"trend={int(trend.loc[p]):,}")
+        comps = [f"{name}={_fmt_count(v)}" for name, v in (("merged", m), ("detailed", d), ("trend", t)) if pd.notna(v)]
         if comps:
             lines.append("  (" + ", ".join(comps) + ")")
     return "\n".join(lines) + "\n"
+
+def format_activity_section(summary_dict):
+    """Steps by hour of day (columns) and weekday (rows) for each month."""
+    heatmap = summary_dict.get("heatmap", pd.DataFrame())
+    if not isinstance(heatmap, pd.DataFrame) or heatmap.empty:
+        return "=== Activity pattern ===\nNo step segments found.\n"
+    lines = ["=== Activity pattern ==="]
+    for k, row in zip(heatmap.index, heatmap.to_numpy()):
+        grid = row.reshape(7, -1).round().astype("int64")
+        width = max(len(str(grid.max())), 2)
+        lines.append(f"\n===== {month_label(k)} =====")
+        lines.append("     " + " ".join(f"{h:02d}".rjust(width) for h in range(grid.shape[1])))
+        for name, counts in zip(WEEKDAYS, grid):
+            lines.append(f"{name}: " + " ".join(f"{c:>{width}}" for c in counts))
+        wd, hour = divmod(int(row.argmax()), grid.shape[1])
+        lines.append(f"Busiest hour: {WEEKDAYS[wd]} {hour:02d}:00")
+    return "\n".join(lines) + "\n"
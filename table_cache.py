@@ -0,0 +1,167 @@
+# table_cache.py
+import hashlib
+import json
+import os
+from pathlib import Path
+import pandas as pd
+from export_fs import signature, source_id
+
+# Parsed tables are stored as parquet when pyarrow is installed, otherwise as pandas pickles
+# (both keep the typed columns, so a warm load skips CSV parsing entirely).
+try:
+    import pyarrow  # noqa: F401
+    _FORMAT = "parquet"
+except ImportError:
+    _FORMAT = "pickle"
+
+DEFAULT_MAX_BYTES = 1024 * 1024 * 1024
+_HASH_BLOCK = 1024 * 1024
+
+_cache_dir = None
+_max_bytes = DEFAULT_MAX_BYTES
+
+
+def configure(cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+    """Enable the cache in cache_dir (None disables it)."""
+    global _cache_dir, _max_bytes
+    _cache_dir = Path(cache_dir) if cache_dir else None
+    _max_bytes = max_bytes
+
+
+def enabled():
+    return _cache_dir is not None
+
+
+def fingerprint(path: Path):
+    """
+    size + mtime + a content tag. Zip members bring their own CRC; for plain files it is a
+    hash of the first and last MiB, since hashing the whole file would cost as much I/O as
+    parsing it, and the sampled hash still catches rewrites that keep size and mtime.
+    """
+    size, mtime, tag = signature(path)
+    if tag is None:
+        h = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            h.update(f.read(_HASH_BLOCK))
+            if size > 2 * _HASH_BLOCK:
+                f.seek(-_HASH_BLOCK, os.SEEK_END)
+                h.update(f.read(_HASH_BLOCK))
+        tag = h.hexdigest()
+    return f"{size}:{mtime}:{tag}"
+
+
+def _entry_paths(path: Path, variant):
+    key = hashlib.blake2b(f"{source_id(path)}|{variant}".encode(), digest_size=16).hexdigest()
+    return _cache_dir / f"{key}.{_FORMAT}", _cache_dir / f"{key}.json"
+
+
+def load(path: Path, variant, debug=False):
+    """Cached table for (path, variant), or None if missing or stale."""
+    if not enabled():
+        return None
+    data_path, meta_path = _entry_paths(path, variant)
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        if meta.get("fingerprint") != fingerprint(path) or meta.get("format") != _FORMAT:
+            if debug:
+                print(f"[cache] [DEBUG] stale entry for {path.name}; dropping")
+            data_path.unlink(missing_ok=True)
+            meta_path.unlink(missing_ok=True)
+            return None
+        df = pd.read_parquet(data_path) if _FORMAT == "parquet" else pd.read_pickle(data_path)
+        os.utime(data_path)  # LRU: eviction goes by data file mtime
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        if debug:
+            print(f"[cache] [DEBUG] failed to read entry for {path.name}: {e}")
+        return None
+    if debug:
+        print(f"[cache] [DEBUG] hit {path.name} ({variant})")
+    return df
+
+
+def store(path: Path, variant, df, debug=False):
+    if not enabled() or df.empty:
+        return
+    data_path, meta_path = _entry_paths(path, variant)
+    try:
+        _cache_dir.mkdir(parents=True, exist_ok=True)
+        meta = {"source": str(path), "variant": variant, "format": _FORMAT, "fingerprint": fingerprint(path)}
+        if _FORMAT == "parquet":
+            df.to_parquet(data_path, index=False)
+        else:
+            df.to_pickle(data_path)
+        meta_path.write_text(json.dumps(meta), encoding="utf-8")
+    except Exception as e:
+        if debug:
+            print(f"[cache] [DEBUG] failed to store {path.name}: {e}")
+        return
+    if debug:
+        print(f"[cache] [DEBUG] stored {path.name} ({variant})")
+    _evict(debug=debug)
+
+
+def _named_path(name):
+    key = hashlib.blake2b(name.encode(), digest_size=16).hexdigest()
+    return _cache_dir / f"{key}.{_FORMAT}"
+
+
+def load_named(name, debug=False):
+    """
+    A frame stored under a plain name by store_named, or None. Used for derived data
+    that carries its own per-row validity keys instead of one source fingerprint.
+    """
+    if not enabled():
+        return None
+    data_path = _named_path(name)
+    try:
+        df = pd.read_parquet(data_path) if _FORMAT == "parquet" else pd.read_pickle(data_path)
+        os.utime(data_path)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        if debug:
+            print(f"[cache] [DEBUG] failed to read {name}: {e}")
+        return None
+    if debug:
+        print(f"[cache] [DEBUG] hit {name} ({len(df)} rows)")
+    return df
+
+
+def store_named(name, df, debug=False):
+    if not enabled():
+        return
+    data_path = _named_path(name)
+    try:
+        _cache_dir.mkdir(parents=True, exist_ok=True)
+        if _FORMAT == "parquet":
+            df.to_parquet(data_path, index=False)
+        else:
+            df.to_pickle(data_path)
+    except Exception as e:
+        if debug:
+            print(f"[cache] [DEBUG] failed to store {name}: {e}")
+        return
+    if debug:
+        print(f"[cache] [DEBUG] stored {name} ({len(df)} rows)")
+    _evict(debug=debug)
+
+
+def _evict(debug=False):
+    entries = []
+    for p in _cache_dir.glob(f"*.{_FORMAT}"):
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        entries.append((st.st_mtime, st.st_size, p))
+    total = sum(size for _, size, _ in entries)
+    for _, size, p in sorted(entries):
+        if total <= _max_bytes:
+            break
+        p.unlink(missing_ok=True)
+        p.with_suffix(".json").unlink(missing_ok=True)
+        total -= size
+        if debug:
+            print(f"[cache] [DEBUG] evicted {p.name}")
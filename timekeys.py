@@ -0,0 +1,58 @@
+# timekeys.py
+import numpy as np
+import pandas as pd
+
+# Internal time keys used for grouping and joining instead of pandas Period objects:
+#   month key = year * 12 + (month - 1)   (int32; consecutive months are consecutive ints)
+#   day key   = days since 1970-01-01      (int32)
+# Conversion to "YYYY-MM" text happens only when a report section is formatted.
+
+
+def month_key(ts):
+    """datetime Series -> int32 month keys (NaT rows must be dropped first)."""
+    return (ts.dt.year * 12 + ts.dt.month - 1).astype("int32")
+
+
+def day_key(ts):
+    """datetime Series -> int32 days since the epoch (NaT rows must be dropped first)."""
+    return pd.Series(ts.to_numpy().astype("datetime64[D]").astype("int32"), index=ts.index)
+
+
+def month_label(key):
+    key = int(key)
+    return f"{key // 12:04d}-{key % 12 + 1:02d}"
+
+
+
+# ---------- rollups over day keys ----------
+PERIODS = ("day", "week", "month", "year")
+
+
+def period_key(days, period):
+    """
+    int day keys (array-like) -> keys of a coarser period, using numpy date arithmetic only.
+    week keys count Monday-based weeks (the epoch is a Thursday, hence the +3).
+    """
+    d = np.asarray(days, dtype="int64")
+    if period == "day":
+        return d.astype("int32")
+    if period == "week":
+        return ((d + 3) // 7).astype("int32")
+    if period == "month":
+        return (d.astype("datetime64[D]").astype("datetime64[M]").astype("int64") + 1970 * 12).astype("int32")
+    if period == "year":
+        return (d.astype("datetime64[D]").astype("datetime64[Y]").astype("int64") + 1970).astype("int32")
+    raise ValueError(f"unknown period {period!r}; expected one of {PERIODS}")
+
+
+def period_label(key, period):
+    key = int(key)
+    if period == "day":
+        return str(np.datetime64(key, "D"))
+    if period == "week":
+        return f"week of {np.datetime64(key * 7 - 3, 'D')}"
+    if period == "month":
+        return month_label(key)
+    if period == "year":
+        return str(key)
+    raise ValueError(f"unknown period {period!r}; expected one of {PERIODS}")